@@ -192,7 +192,8 @@ scheduler_events = {
 	# "all": [
 	# 	"saturn.tasks.all"
 	# ],
-    "daily": [
+    # long queue: the consumption store's full rebuild outlasts the default queue's timeout
+    "daily_long": [
         "saturn.utils.inventory_engine.execute_daily_reorder_update"
     ],
 	# "hourly": [
@@ -201,9 +202,9 @@ scheduler_events = {
 	# "weekly": [
 	# 	"saturn.tasks.weekly"
 	# ],
-	# "monthly": [
-	# 	"saturn.tasks.monthly"
-	# ],
+    "monthly": [
+        "saturn.utils.closing_balance.create_monthly_closing_balances"
+    ],
 }
 
 # Testing
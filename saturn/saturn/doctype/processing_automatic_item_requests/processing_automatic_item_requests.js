@@ -2,7 +2,43 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on('Processing Automatic Item Requests', {
+    onload: function(frm) {
+        // إعادة تحميل المستند عند انتهاء العملية الخلفية
+        frappe.realtime.on('saturn_schedule_job', function(data) {
+            if (data.name === frm.doc.name) {
+                frm.reload_doc();
+                frappe.show_alert({
+                    message: __('{0}: {1}', [data.action, data.status]),
+                    indicator: data.status === 'Completed' ? 'green' : 'red'
+                });
+            }
+        });
+    },
+
     refresh: function(frm) {
+        // قفل النموذج أثناء تنفيذ عملية في الخلفية، بعد التأكد من السيرفر أن المهمة ما زالت قائمة
+        if (['Queued', 'Running'].includes(frm.doc.job_status)) {
+            frm.disable_form();
+            frm.set_intro(__('يتم تنفيذ عملية في الخلفية على هذا المستند'), 'orange');
+            frm.call('check_background_job').then((r) => {
+                if (r.message !== frm.doc.job_status) {
+                    frm.reload_doc();
+                }
+            });
+            return;
+        }
+
+        // إعادة تشغيل عملية خلفية فشلت أو توقف عاملها
+        if (frm.doc.job_status === 'Failed' && frm.doc.job_action) {
+            frm.add_custom_button(__('Retry Background Job'), function() {
+                frm.call('retry_background_action').then((r) => {
+                    if (!r.exc) {
+                        frm.reload_doc();
+                    }
+                });
+            });
+        }
+
         // إضافة زر للتحقق من قيم Reorder
         if (frm.doc.docstatus === 0) {
             frm.add_custom_button(__('Check Reorder Values'), function() {
@@ -57,14 +93,24 @@ frappe.ui.form.on('Processing Automatic Item Requests', {
     },
     
     get_items: function(frm) {
-        // استدعاء دالة جلب الأصناف من السيرفر
-        frm.call('get_items').then((r) => {
-            if (!r.exc) {
-                frm.refresh_field('automated_item_request_processing_schedule');
+        // حفظ المستند الجديد أولاً حتى يتمكن العامل الخلفي من قراءته، ثم جلب الأصناف من السيرفر
+        let saved = frm.is_new() ? frm.save() : Promise.resolve();
+        saved.then(() => frm.call('get_items')).then((r) => {
+            if (r && !r.exc) {
+                frm.reload_doc();
             }
         });
     },
     
+    refresh_outflow: function(frm) {
+        // إعادة أخذ لقطة الكميات من المخازن؛ الحفظ العادي يعيد حساب المعدلات فقط
+        frm.call('refresh_outflow').then((r) => {
+            if (!r.exc) {
+                frm.refresh_fields();
+            }
+        });
+    },
+
     update_all_rows: function(frm) {
         // تحديث جميع الصفوف في الجدول عند تغيير عدد الأيام
         if (frm.doc.automated_item_request_processing_schedule && 
@@ -127,20 +173,13 @@ frappe.ui.form.on('Automated Item Request Processing Schedule', {
     item: function(frm, cdt, cdn) {
         var row = locals[cdt][cdn];
         if (row.item) {
-            // جلب كمية الصنف من المستودعات المحددة
-            frm.call({
-                method: 'get_item_quantity_in_stores',
-                doc: frm.doc,
-                args: {
-                    item_code: row.item
-                },
-                callback: function(r) {
-                    if (r.message > 0) {
-                        row.outflow_qty = r.message;
-                        frm.trigger('calculate_row_values', cdt, cdn);
-                    }
-                }
-            });
+            // تجميع الصفوف المعدلة وجلب كمياتها بطلب واحد بعد توقف التعديل
+            frm.pending_outflow_rows = frm.pending_outflow_rows || new Set();
+            frm.pending_outflow_rows.add(cdn);
+            clearTimeout(frm.pending_outflow_timeout);
+            frm.pending_outflow_timeout = setTimeout(function() {
+                fetch_pending_outflow(frm, cdt);
+            }, 300);
         }
     },
     outflow_qty: function(frm, cdt, cdn) {
@@ -171,4 +210,35 @@ frappe.ui.form.on('Automated Item Request Processing Schedule', {
             }
         }
     }    
-});
\ No newline at end of file
+});
+
+function fetch_pending_outflow(frm, cdt) {
+    var rows = Array.from(frm.pending_outflow_rows || [])
+        .map(function(cdn) { return locals[cdt][cdn]; })
+        .filter(function(row) { return row && row.item; });
+    frm.pending_outflow_rows = new Set();
+
+    if (!rows.length) {
+        return;
+    }
+
+    // جلب الكميات المنصرفة لجميع الصفوف المعلقة من المستودعات المحددة
+    frappe.call({
+        method: 'saturn.saturn.doctype.processing_automatic_item_requests.processing_automatic_item_requests.get_outflow_for_items',
+        args: {
+            item_codes: rows.map(function(row) { return row.item; }),
+            check_in_group: frm.doc.check_in_group,
+            from_date: frm.doc.from_date,
+            to_date: frm.doc.to_date
+        },
+        callback: function(r) {
+            var quantities = r.message || {};
+            rows.forEach(function(row) {
+                if (quantities[row.item] > 0) {
+                    row.outflow_qty = quantities[row.item];
+                    frm.trigger('calculate_row_values', row.doctype, row.name);
+                }
+            });
+        }
+    });
+}
@@ -3,15 +3,24 @@
 
 import frappe
 from frappe.model.document import Document
-from frappe.utils import date_diff, getdate
+from frappe.utils import date_diff, getdate, now_datetime
+from frappe.utils.background_jobs import is_job_enqueued
 import math
 
+from saturn.utils.batching import get_batches
+from saturn.utils.item_reorder import bulk_delete_item_reorder, bulk_upsert_item_reorder
+
+# الجداول الأكبر من هذا الحد تُعالج في عامل خلفية بدلاً من طلب HTTP
+BACKGROUND_JOB_ROWS = 500
+BACKGROUND_ACTIONS = ("get_items", "submit", "cancel")
+
 class ProcessingAutomaticItemRequests(Document):
     def validate(self):
+        self.validate_background_job()
         self.calculate_number_of_days()
     
     def before_save(self):
-        """تحديث القيم في الجدول الفرعي"""
+        """تحديث القيم المشتقة في الجدول الفرعي من لقطة الكميات المحفوظة دون أي استعلام"""
         self.update_child_table_values()
     
     def before_submit(self):
@@ -65,11 +74,26 @@ class ProcessingAutomaticItemRequests(Document):
         # احتساب عدد الأيام أولاً
         self.calculate_number_of_days()
         
+        item_filters = {"item_group": self.item_group, "disabled": 0}
+        if frappe.db.count("Item", item_filters) > BACKGROUND_JOB_ROWS:
+            if self.is_new():
+                frappe.throw("يرجى حفظ المستند أولاً، فجلب هذا العدد من الأصناف يتم في الخلفية")
+            
+            # حفظ المدخلات الحالية ليقرأها العامل الخلفي
+            self.save()
+            self.enqueue_background_action("get_items")
+            return
+        
+        self.set_items()
+    
+    def set_items(self):
+        """بناء الجدول الفرعي من أصناف المجموعة ثم الحفظ"""
         # جلب جميع الأصناف في المجموعة
         items = frappe.get_all("Item", 
             filters={"item_group": self.item_group, "disabled": 0},
             fields=["name", "item_name", "item_code"]
         )
+        self.publish_job_progress(1, 3, "جلب الأصناف")
         
         # تنظيف الجدول الحالي
         self.set("automated_item_request_processing_schedule", [])
@@ -77,29 +101,47 @@ class ProcessingAutomaticItemRequests(Document):
         # إضافة الأصناف إلى الجدول فقط إذا كانت outflow_qty > 0
         items_added = 0
         for item in items:
-            outflow_qty = self.get_item_quantity_in_stores(item.item_code)
             # if outflow_qty > 0:
             row = self.append("automated_item_request_processing_schedule", {})
             row.item = item.item_code
-            row.outflow_qty = outflow_qty
-            self.calculate_row_values(row)
             items_added += 1
         
+        # أخذ لقطة كميات جميع أصناف المجموعة باستعلام واحد
+        self.take_outflow_snapshot()
+        self.publish_job_progress(2, 3, "حساب الكميات المنصرفة")
+        
         if items_added > 0:
             frappe.msgprint(f"تمت إضافة {items_added} صنف")
         else:
             frappe.msgprint("لم يتم العثور على أصناف متاحة في المستودعات المحددة")
         
         self.save()
+        self.publish_job_progress(3, 3, "حفظ المستند")
+    
+    @frappe.whitelist()
+    def refresh_outflow(self):
+        """إعادة أخذ لقطة outflow_qty لجميع الصفوف ثم الحفظ"""
+        self.check_permission("write")
+        self.take_outflow_snapshot()
+        self.save()
+    
+    def take_outflow_snapshot(self):
+        """جلب outflow_qty لجميع الصفوف باستعلام واحد وتسجيل وقت اللقطة"""
+        quantities = self.get_items_outflow(
+            [row.item for row in self.automated_item_request_processing_schedule if row.item]
+        )
+        
+        for row in self.automated_item_request_processing_schedule:
+            if row.item:
+                row.outflow_qty = quantities.get(row.item, 0)
+        
+        self.outflow_snapshot_at = now_datetime()
     
     def calculate_row_values(self, row):
-        """احتساب القيم للصف في الجدول الفرعي"""
+        """احتساب القيم للصف في الجدول الفرعي من outflow_qty المحفوظة في اللقطة"""
         if not row.item:
             return
         
-        # حساب outflow_qty من المخازن
-        row.outflow_qty = self.get_item_quantity_in_stores(row.item)
-        
         # حساب القيم الأخرى
         if self.number_of_days and self.number_of_days > 0:
             row.daily_withdrawal_rate = row.outflow_qty / self.number_of_days
@@ -108,29 +150,12 @@ class ProcessingAutomaticItemRequests(Document):
 
     @frappe.whitelist()
     def get_item_quantity_in_stores(self, item_code):
-        """جلب كمية الصنف في جميع المخازن تحت Stores - S"""
-        total_qty = 0
-        
-        # جلب جميع المخازن التي تحت الأب "Stores - S"
-        warehouses = frappe.get_all("Warehouse",
-            filters={"parent_warehouse": "Stores - S"},
-            pluck="name"
-        )
-        
-        if warehouses:
-            # جلب الكمية من جدول Bin
-            bin_data = frappe.get_all("Bin",
-                filters={
-                    "item_code": item_code,
-                    "warehouse": ["in", warehouses]
-                },
-                fields=["sum(actual_qty) as total_qty"]
-            )
-            
-            if bin_data and bin_data[0].total_qty:
-                total_qty = bin_data[0].total_qty
-        
-        return total_qty
+        """جلب الكمية المنصرفة للصنف من مخازن check_in_group خلال فترة المستند"""
+        return self.get_items_outflow([item_code]).get(item_code, 0)
+    
+    def get_items_outflow(self, item_codes):
+        """جلب الكميات المنصرفة لمجموعة أصناف من دفتر الأستاذ بين from_date و to_date"""
+        return get_items_outflow(item_codes, self.check_in_group, self.from_date, self.to_date)
     
     def update_child_table_values(self):
         """تحديث جميع الصفوف في الجدول الفرعي"""
@@ -139,16 +164,16 @@ class ProcessingAutomaticItemRequests(Document):
         
         for row in self.automated_item_request_processing_schedule:
             if row.item:
-                # تحديث outflow_qty إذا لزم الأمر
-                if not row.outflow_qty:
-                    row.outflow_qty = self.get_item_quantity_in_stores(row.item)
-                
                 # إعادة حساب القيم
                 self.calculate_row_values(row)
     
     def on_submit(self):
-        """عند اعتماد المستند، قم بإضافة Reorder Levels للأصناف"""
-        self.add_reorder_levels_to_items()
+        """عند اعتماد المستند، قم بإضافة Reorder Levels للأصناف
+        (في الخلفية للجداول الكبيرة بعد اعتماد المعاملة)"""
+        if self.run_in_background():
+            self.enqueue_background_action("submit")
+        else:
+            self.add_reorder_levels_to_items()
     
     def add_reorder_levels_to_items(self):
         """إضافة Reorder Levels للأصناف في الجدول الفرعي إلى سجل كل صنف"""
@@ -158,68 +183,197 @@ class ProcessingAutomaticItemRequests(Document):
         if not self.request_for:
             frappe.throw("يجب تحديد المستودع المطلوب (Request for) قبل الاعتماد")
         
-        items_processed = 0
+        frappe.has_permission("Item", "write", throw=True)
+
+        # تجميع سجلات Reorder للمستودع المحدد وكتابتها دفعة واحدة بدلاً من حفظ كل صنف
+        reorder_rows = []
         for row in self.automated_item_request_processing_schedule:
             if not row.item or row.warehouse_reorder_level == 0 or row.warehouse_reorder_qty == 0:
                 continue
-            
-            # جلب مستند الصنف
-            item_doc = frappe.get_doc("Item", row.item)
-            
-            # إنشاء قائمة جديدة بدون السجلات الخاصة بالمستودع المحدد
-            new_reorder_levels = []
-            for reorder in item_doc.get("reorder_levels", []):
-                if reorder.warehouse != self.request_for:
-                    new_reorder_levels.append(reorder)
-            
-            # مسح الجدول وإعادة إضافة السجلات المتبقية
-            item_doc.set("reorder_levels", new_reorder_levels)
-            
-            # إضافة سجل Reorder جديد للمستودع المحدد
-            reorder_row = {
+
+            reorder_rows.append({
+                "item_code": row.item,
                 "warehouse": self.request_for,
-                "warehouse_group" : self.check_in_group,
+                "warehouse_group": self.check_in_group,
                 "warehouse_reorder_level": row.warehouse_reorder_level,
                 "warehouse_reorder_qty": row.warehouse_reorder_qty,
                 "material_request_type": self.material_request_type or "Purchase"
-            }
-            
-            item_doc.append("reorder_levels", reorder_row)
-            
-            # حفظ التغييرات
-            item_doc.save()
-            items_processed += 1
+            })
+
+        batches = list(get_batches(reorder_rows))
+        for i, batch in enumerate(batches, 1):
+            bulk_upsert_item_reorder(batch)
+            self.publish_job_progress(i, len(batches), "تحديث إعدادات إعادة الطلب")
+        items_processed = len(reorder_rows)
         
         frappe.msgprint(f"تم تحديث إعدادات إعادة الطلب لـ {items_processed} صنف في المستودع {self.request_for}")
     
     def on_cancel(self):
-        """عند إلغاء المستند، قم بإزالة Reorder Levels من الأصناف"""
-        self.remove_reorder_levels_from_items()
+        """عند إلغاء المستند، قم بإزالة Reorder Levels من الأصناف
+        (في الخلفية للجداول الكبيرة بعد اعتماد المعاملة)"""
+        if self.run_in_background():
+            self.enqueue_background_action("cancel")
+        else:
+            self.remove_reorder_levels_from_items()
     
     def remove_reorder_levels_from_items(self):
         """إزالة Reorder Levels من الأصناف"""
         if not self.automated_item_request_processing_schedule or not self.request_for:
             return
         
-        items_processed = 0
-        for row in self.automated_item_request_processing_schedule:
-            if not row.item:
-                continue
-            
-            # جلب مستند الصنف
-            item_doc = frappe.get_doc("Item", row.item)
-            
-            # إنشاء قائمة جديدة بدون السجلات الخاصة بالمستودع المحدد
-            new_reorder_levels = []
-            for reorder in item_doc.get("reorder_levels", []):
-                if reorder.warehouse != self.request_for:
-                    new_reorder_levels.append(reorder)
-            
-            # مسح الجدول وإعادة إضافة السجلات المتبقية
-            item_doc.set("reorder_levels", new_reorder_levels)
-            
-            # حفظ التغييرات
-            item_doc.save()
-            items_processed += 1
+        frappe.has_permission("Item", "write", throw=True)
+
+        # حذف سجلات Reorder الخاصة بالمستودع المحدد لجميع الأصناف باستعلام واحد
+        item_codes = [row.item for row in self.automated_item_request_processing_schedule if row.item]
+        batches = list(get_batches(item_codes))
+        for i, batch in enumerate(batches, 1):
+            bulk_delete_item_reorder(batch, self.request_for)
+            self.publish_job_progress(i, len(batches), "إزالة إعدادات إعادة الطلب")
+        items_processed = len(item_codes)
+        
+        frappe.msgprint(f"تم إزالة إعدادات إعادة الطلب لـ {items_processed} صنف من المستودع {self.request_for}")
+    
+    def run_in_background(self):
+        return (
+            not self.flags.in_background_job
+            and len(self.automated_item_request_processing_schedule) > BACKGROUND_JOB_ROWS
+        )
+    
+    def get_background_job_id(self):
+        return f"processing_automatic_item_requests::{self.name}"
+    
+    def validate_background_job(self):
+        """منع التعديل أثناء تشغيل عامل خلفي على المستند"""
+        if self.flags.in_background_job or self.is_new():
+            return
         
-        frappe.msgprint(f"تم إزالة إعدادات إعادة الطلب لـ {items_processed} صنف من المستودع {self.request_for}")
\ No newline at end of file
+        if is_job_enqueued(self.get_background_job_id()):
+            frappe.throw("يتم حالياً تنفيذ عملية في الخلفية على هذا المستند، يرجى الانتظار حتى تنتهي")
+    
+    def enqueue_background_action(self, action):
+        """إرسال العملية إلى عامل خلفي؛ معرّف المهمة ثابت لكل مستند فلا تتكرر المهمة،
+        وإذا توقف العامل يمكن إعادة تشغيلها لأن جميع العمليات قابلة للإعادة"""
+        self.validate_background_job()
+        self.check_permission({"submit": "submit", "cancel": "cancel"}.get(action, "write"))
+        
+        self.db_set({"job_status": "Queued", "job_action": action}, update_modified=False)
+        frappe.enqueue(
+            "saturn.saturn.doctype.processing_automatic_item_requests.processing_automatic_item_requests.run_background_action",
+            queue="long",
+            timeout=3600,
+            job_id=self.get_background_job_id(),
+            deduplicate=True,
+            enqueue_after_commit=True,
+            name=self.name,
+            action=action,
+            user=frappe.session.user
+        )
+        
+        frappe.msgprint("تمت جدولة العملية في الخلفية، سيتم تحديث المستند عند انتهائها")
+    
+    @frappe.whitelist()
+    def check_background_job(self):
+        """إعادة حالة المهمة؛ إذا توقف العامل دون تحديثها تُعلَّم كفاشلة لتمكين إعادة المحاولة"""
+        if self.job_status in ("Queued", "Running") and not is_job_enqueued(self.get_background_job_id()):
+            self.db_set("job_status", "Failed", update_modified=False)
+        
+        return self.job_status
+    
+    @frappe.whitelist()
+    def retry_background_action(self):
+        """إعادة تشغيل آخر عملية خلفية فشلت؛ جميع العمليات قابلة للإعادة"""
+        if self.check_background_job() != "Failed" or self.job_action not in BACKGROUND_ACTIONS:
+            frappe.throw("لا توجد عملية خلفية فاشلة لإعادة تشغيلها")
+        
+        self.enqueue_background_action(self.job_action)
+    
+    def publish_job_progress(self, done, total, description):
+        if self.flags.in_background_job and total:
+            frappe.publish_progress(
+                done * 100 / total,
+                title=self.doctype,
+                doctype=self.doctype,
+                docname=self.name,
+                description=description
+            )
+
+
+@frappe.whitelist()
+def get_outflow_for_items(item_codes, check_in_group, from_date, to_date):
+    """نقطة دفعية للنموذج: الكميات المنصرفة لعدة صفوف في طلب واحد دون إرسال المستند كاملاً"""
+    frappe.has_permission("Processing Automatic Item Requests", "read", throw=True)
+    return get_items_outflow(frappe.parse_json(item_codes), check_in_group, from_date, to_date)
+
+
+def get_items_outflow(item_codes, check_in_group, from_date, to_date):
+    """جلب الكميات المنصرفة لمجموعة أصناف من دفتر الأستاذ بين from_date و to_date
+
+    يتم تحديد المخازن عبر نطاق lft/rgt للمستودع check_in_group فتشمل الشجرة كاملة،
+    وتُجمع كميات جميع الأصناف باستعلام واحد مجمّع حسب الصنف.
+    التحويلات الداخلية (قيود Stock Entry التي مستودعها الهدف داخل الشجرة نفسها)
+    لا تُحتسب كمنصرف لأن الكمية لم تخرج من المجموعة
+    """
+    if not item_codes or not check_in_group or not from_date or not to_date:
+        return {}
+    
+    lft, rgt = frappe.db.get_value("Warehouse", check_in_group, ["lft", "rgt"]) or (None, None)
+    if not lft:
+        return {}
+    
+    return frappe._dict(frappe.db.sql("""
+        SELECT sle.item_code, SUM(sle.actual_qty * -1)
+        FROM `tabStock Ledger Entry` sle
+        INNER JOIN `tabWarehouse` wh ON wh.name = sle.warehouse
+        LEFT JOIN `tabStock Entry Detail` sed
+            ON sle.voucher_type = 'Stock Entry' AND sed.name = sle.voucher_detail_no
+        LEFT JOIN `tabWarehouse` target ON target.name = sed.t_warehouse
+        WHERE sle.actual_qty < 0
+        AND sle.is_cancelled = 0
+        AND sle.posting_date BETWEEN %(from_date)s AND %(to_date)s
+        AND wh.lft >= %(lft)s AND wh.rgt <= %(rgt)s
+        AND (target.name IS NULL OR target.lft < %(lft)s OR target.rgt > %(rgt)s)
+        AND sle.item_code IN %(item_codes)s
+        GROUP BY sle.item_code
+    """, {
+        "from_date": from_date,
+        "to_date": to_date,
+        "lft": lft,
+        "rgt": rgt,
+        "item_codes": tuple(set(item_codes))
+    }))
+
+
+def run_background_action(name, action, user=None):
+    """تنفيذ get_items أو كتابة/إزالة Reorder Levels للمستند المعتمد/الملغى في عامل خلفي ضمن معاملة واحدة"""
+    if action not in BACKGROUND_ACTIONS:
+        return
+    
+    doctype = "Processing Automatic Item Requests"
+    frappe.db.set_value(doctype, name, "job_status", "Running", update_modified=False)
+    frappe.db.commit()
+    
+    doc = frappe.get_doc(doctype, name)
+    doc.flags.in_background_job = True
+    
+    try:
+        if action == "get_items":
+            doc.set_items()
+        elif action == "submit":
+            doc.add_reorder_levels_to_items()
+        else:
+            doc.remove_reorder_levels_from_items()
+    except Exception:
+        frappe.db.rollback()
+        status = "Failed"
+        frappe.log_error(title=f"Saturn: {action} failed for {name}", message=frappe.get_traceback())
+    else:
+        status = "Completed"
+    
+    frappe.db.set_value(doctype, name, "job_status", status, update_modified=False)
+    frappe.db.commit()
+    
+    frappe.publish_realtime(
+        "saturn_schedule_job",
+        {"name": name, "action": action, "status": status},
+        user=user
+    )
@@ -0,0 +1,8 @@
+// Copyright (c) 2026, Asofi and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Saturn Daily Consumption", {
+// 	refresh(frm) {
+
+// 	},
+// });
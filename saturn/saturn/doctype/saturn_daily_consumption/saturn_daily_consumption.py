@@ -0,0 +1,13 @@
+# Copyright (c) 2026, Asofi and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SaturnDailyConsumption(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Saturn Daily Consumption", ["posting_date", "item_code"])
@@ -0,0 +1,54 @@
+# Copyright (c) 2026, Asofi and Contributors
+# See license.txt
+
+import frappe
+from erpnext.stock.doctype.stock_entry.stock_entry_utils import make_stock_entry
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import now_datetime, today
+
+from saturn.utils.consumption_store import apply_ledger_delta, rebuild_consumption_store
+
+ITEM = "_Test Item"
+WAREHOUSE = "_Test Warehouse - _TC"
+RETENTION_DAYS = 30
+
+
+def get_consumed_qty():
+	return frappe.db.get_value(
+		"Saturn Daily Consumption",
+		{"item_code": ITEM, "warehouse": WAREHOUSE, "posting_date": today()},
+		"consumed_qty",
+	) or 0.0
+
+
+class TestSaturnDailyConsumption(FrappeTestCase):
+	def test_cancelled_issue_nets_to_zero_once(self):
+		make_stock_entry(item_code=ITEM, target=WAREHOUSE, qty=10, basic_rate=100)
+
+		# the store is complete up to here, so the deltas below own the day's change
+		watermark = now_datetime()
+		rebuild_consumption_store(RETENTION_DAYS, watermark)
+		before = get_consumed_qty()
+
+		issue = make_stock_entry(item_code=ITEM, source=WAREHOUSE, qty=4)
+		upto = now_datetime()
+		apply_ledger_delta(watermark, upto, RETENTION_DAYS)
+		self.assertEqual(get_consumed_qty(), before + 4)
+
+		issue.cancel()
+		watermark, upto = upto, now_datetime()
+		apply_ledger_delta(watermark, upto, RETENTION_DAYS)
+		self.assertEqual(get_consumed_qty(), before)
+
+		# a later change to the cancelled entries must not subtract them again
+		frappe.db.sql(
+			"UPDATE `tabStock Ledger Entry` SET modified = %s WHERE voucher_no = %s",
+			(now_datetime(), issue.name),
+		)
+		watermark, upto = upto, now_datetime()
+		apply_ledger_delta(watermark, upto, RETENTION_DAYS)
+		self.assertEqual(get_consumed_qty(), before)
+
+		incremental = get_consumed_qty()
+		rebuild_consumption_store(RETENTION_DAYS, upto)
+		self.assertEqual(get_consumed_qty(), incremental)
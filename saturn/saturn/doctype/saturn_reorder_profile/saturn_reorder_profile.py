@@ -1,9 +1,20 @@
 # Copyright (c) 2026, Asofi and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
+from frappe import _
 from frappe.model.document import Document
+from frappe.utils import cint, flt
 
 
 class SaturnReorderProfile(Document):
-	pass
+	def validate(self):
+		if self.engine_mode == "Forecast":
+			self.validate_forecast_settings()
+
+	def validate_forecast_settings(self):
+		if self.forecast_method == "Exponential Smoothing" and not (0 < flt(self.smoothing_factor) <= 1):
+			frappe.throw(_("Smoothing Factor must be greater than 0 and at most 1"))
+
+		if self.forecast_method == "Moving Average" and cint(self.moving_average_days) <= 0:
+			frappe.throw(_("Moving Average (Days) must be greater than 0"))
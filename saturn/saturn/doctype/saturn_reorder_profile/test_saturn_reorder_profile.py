@@ -1,9 +1,49 @@
 # Copyright (c) 2026, Asofi and Contributors
 # See license.txt
 
-# import frappe
+import frappe
+import numpy as np
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, today
+
+from saturn.utils.demand_forecast import exponential_smoothing, get_consumption_matrix, moving_average
 
 
 class TestSaturnReorderProfile(FrappeTestCase):
-	pass
+	def test_exponential_smoothing_matches_recursion(self):
+		matrix = np.array([[4.0, 0.0, 6.0, 2.0, 8.0], [1.0, 1.0, 1.0, 1.0, 1.0]])
+		alpha = 0.3
+
+		for row, smoothed in zip(matrix, exponential_smoothing(matrix, alpha)):
+			level = row[0]
+			for value in row[1:]:
+				level = alpha * value + (1 - alpha) * level
+			self.assertAlmostEqual(smoothed, level)
+
+	def test_exponential_smoothing_known_values(self):
+		# 10 → 0.5·20 + 0.5·10 = 15 → 0.5·0 + 0.5·15 = 7.5
+		self.assertAlmostEqual(exponential_smoothing(np.array([[10.0, 20.0, 0.0]]), 0.5)[0], 7.5)
+		self.assertAlmostEqual(exponential_smoothing(np.array([[5.0, 5.0, 5.0]]), 0.2)[0], 5.0)
+
+	def test_moving_average_window(self):
+		matrix = np.array([[1.0, 2.0, 3.0, 6.0]])
+		self.assertAlmostEqual(moving_average(matrix, 2)[0], 4.5)
+		self.assertAlmostEqual(moving_average(matrix, 10)[0], 3.0)
+
+	def test_consumption_matrix_ends_yesterday(self):
+		item_code = "_Test Saturn Forecast Item"
+		for days_ago, qty in ((0, 100), (1, 7), (3, 5), (4, 9)):
+			frappe.get_doc({
+				"doctype": "Saturn Daily Consumption",
+				"name": f"{item_code}-{days_ago}",
+				"item_code": item_code,
+				"warehouse": "_Test Warehouse - _TC",
+				"posting_date": add_days(today(), -days_ago),
+				"consumed_qty": qty,
+			}).db_insert()
+
+		matrix = get_consumption_matrix([item_code], 3)
+
+		# today is partial and the fourth day back is outside the period
+		self.assertEqual(matrix.shape, (1, 3))
+		self.assertEqual(matrix.tolist(), [[5.0, 0.0, 7.0]])
@@ -2,16 +2,35 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on('Saturn Settings', {
+    onload: function(frm) {
+        // متابعة تقدم دفعات محرك إعادة الطلب في الخلفية
+        frappe.realtime.on("saturn_reorder_progress", function(data) {
+            frm.dashboard.show_progress(
+                __("Reorder Update"),
+                (data.done / data.total) * 100,
+                __("{0} of {1} chunks processed", [data.done, data.total])
+            );
+
+            if (data.done >= data.total) {
+                frm.dashboard.hide_progress(__("Reorder Update"));
+                frappe.show_alert({
+                    message: __("تم تحديث المستويات وإنشاء طلبات المواد بنجاح!"),
+                    indicator: "green"
+                });
+            }
+        });
+    },
+
     update_reorder_btn: function(frm) {
         frappe.confirm(__('هل أنت متأكد من رغبتك في تحديث مستويات إعادة الطلب وإصدار طلبات المواد الآن؟'), function() {
             // إظهار رسالة تحميل للمستخدم
             frm.dashboard.set_headline(__("جاري تحليل البيانات وتحديث المخزون... يرجى الانتظار."));
-            
+
             frappe.call({
-                method: "saturn.utils.inventory_engine.execute_daily_reorder_update",
+                method: "saturn.utils.inventory_engine.enqueue_reorder_update",
                 callback: function(r) {
                     if(!r.exc) {
-                        frappe.msgprint(__("تم تحديث المستويات وإنشاء طلبات المواد بنجاح!"));
+                        frappe.show_alert({message: r.message, indicator: "blue"});
                         frm.dashboard.clear_headline();
                     }
                 }
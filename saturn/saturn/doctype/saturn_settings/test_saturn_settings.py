@@ -1,9 +1,44 @@
 # Copyright (c) 2026, Asofi and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from saturn.utils.replica import read_from_replica
+
+
+class UnreachableReplica:
+	def connect(self):
+		raise ConnectionRefusedError("replica is down")
+
+	def close(self):
+		pass
+
+
+def connect_unreachable_replica():
+	# same swap as frappe.connect_replica, whose connection is only opened on first use
+	frappe.local.replica_db = UnreachableReplica()
+	frappe.local.primary_db = frappe.local.db
+	frappe.local.db = frappe.local.replica_db
+	return True
+
 
 class TestSaturnSettings(FrappeTestCase):
-	pass
+	def test_unreachable_replica_falls_back_to_primary(self):
+		primary_db = frappe.local.db
+
+		with (
+			patch("saturn.utils.replica.use_replica", return_value=True),
+			patch("frappe.connect_replica", connect_unreachable_replica),
+			patch("frappe.log_error") as log_error,
+		):
+			with read_from_replica("replica_for_stock_balance_report"):
+				self.assertIs(frappe.local.db, primary_db)
+				self.assertEqual(frappe.db.sql("SELECT 1")[0][0], 1)
+
+		log_error.assert_called_once()
+		self.assertIs(frappe.local.db, primary_db)
+		self.assertFalse(hasattr(frappe.local, "replica_db"))
+		self.assertFalse(hasattr(frappe.local, "primary_db"))
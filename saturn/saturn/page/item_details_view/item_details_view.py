@@ -1,5 +1,8 @@
 import frappe
 from frappe import _
+
+from saturn.utils.replica import read_from_replica
+
 # الدالة الجديدة لجلب معلومات الشركة
 @frappe.whitelist()
 def get_company_info():
@@ -29,6 +32,7 @@ def get_company_info():
 
 # الدالة الحالية تبقى كما هي
 @frappe.whitelist()
+@read_from_replica("replica_for_item_scan")
 def get_item_details_and_stock(scanned_value):
     
     item_code = None
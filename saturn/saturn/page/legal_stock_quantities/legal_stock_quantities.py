@@ -1,5 +1,7 @@
 import frappe
 
+from saturn.utils.replica import read_from_replica
+
 # **كانت هذه الدالة مفقودة في الكود الذي أرسلته*
 @frappe.whitelist()
 def get_company_info():
@@ -29,6 +31,7 @@ def get_company_info():
 
 
 @frappe.whitelist()
+@read_from_replica("replica_for_item_scan")
 def get_item_details_and_stock(scanned_value):
     
     item_code = None
@@ -113,38 +113,25 @@ frappe.query_reports["Stock Balance With Barcode Scanning Feature"] = {
             label: __("Barcode"),
             fieldtype: "Data",
             width: "80",
-            nchange: function() {
-                let barcode_value = frappe.query_report.get_filter_value("barcode");
-                if (barcode_value) {
-                    frappe.db.get_value("Item Barcode", { barcode: barcode_value }, "parent").then(r => {
-                        if (r && r.parent) {
-                            frappe.query_report.set_filter_value("item_code", r.parent);
-                        } else {
-                            frappe.msgprint(__("No Item found for this barcode."));
-                            frappe.query_report.set_filter_value("item_code", "");
-                        }
-
-                        frappe.query_report.refresh();
-
-                        //Refocus the barcode field without clearing
-                        setTimeout(() => {
-
-                            let barcode_input = frappe.query_report.page.fields_dict["barcode"].$input;
-
-                            if (barcode_input) {
-                                barcode_input.focus();
-                            } else {
-                                console.error("Barcode input not found for selection.");
-                            }
-
-                        }, 750);
-                    });
+            on_change: function(query_report) {
+                if (query_report.get_filter_value("scan_session")) {
+                    add_scanned_barcode(query_report);
                 } else {
-                    frappe.query_report.set_filter_value("item_code", "");
-                    frappe.query_report.refresh();
+                    // السيرفر يحوّل الباركود إلى الصنف بنفسه
+                    query_report.refresh();
                 }
             },
         },
+        // جلسة مسح: كل باركود جديد يضيف صفوفه إلى الجدول دون إعادة حساب ما سبق
+        {
+            fieldname: "scan_session",
+            label: __("Scan Session"),
+            fieldtype: "Check",
+            default: 0,
+            on_change: function(query_report) {
+                query_report.refresh();
+            },
+        },
     ],
 
     formatter: function (value, row, column, data, default_formatter) {
@@ -161,6 +148,38 @@ frappe.query_reports["Stock Balance With Barcode Scanning Feature"] = {
 
     // إضافة وظيفة rendered
     onload: function(query_report) {
+        // أي إعادة تشغيل للتقرير تفرغ الجدول، فتبدأ جلسة المسح من جديد
+        const refresh = query_report.refresh.bind(query_report);
+        query_report.refresh = function(...args) {
+            query_report.scanned_barcodes = [];
+            return refresh(...args);
+        };
+
+        // تصدير التقرير في الخلفية إلى ملف بدلاً من بناء البيانات كاملة في المتصفح
+        query_report.page.add_inner_button(__("Export in Background"), function() {
+            frappe.prompt(
+                {
+                    fieldname: "file_format",
+                    label: __("File Format"),
+                    fieldtype: "Select",
+                    options: "CSV\nParquet",
+                    default: "CSV",
+                    reqd: 1,
+                },
+                (values) => {
+                    frappe.call({
+                        method: "saturn.utils.stock_balance_export.export_report",
+                        args: {
+                            filters: query_report.get_filter_values(),
+                            file_format: values.file_format,
+                        },
+                        callback: (r) => r.message && frappe.show_alert({ message: r.message, indicator: "blue" }),
+                    });
+                },
+                __("Export in Background")
+            );
+        });
+
         setTimeout(() => {
 
             //  التحقق من وجود الحقل قبل محاولة تفعيله
@@ -191,3 +210,51 @@ frappe.query_reports["Stock Balance With Barcode Scanning Feature"] = {
 
 // تمرير كائن التقرير إلى الدالة add_inventory_dimensions
 erpnext.utils.add_inventory_dimensions(frappe.query_reports["Stock Balance With Barcode Scanning Feature"], 8);
+
+function add_scanned_barcode(query_report) {
+    let barcode = query_report.get_filter_value("barcode");
+    if (!barcode) {
+        return;
+    }
+
+    query_report.scanned_barcodes = query_report.scanned_barcodes || [];
+    if (query_report.scanned_barcodes.includes(barcode)) {
+        frappe.show_alert({ message: __("Barcode {0} is already scanned", [barcode]), indicator: "orange" });
+        refocus_barcode(query_report);
+        return;
+    }
+
+    // حساب صفوف الصنف الممسوح فقط وإضافتها إلى البيانات الحالية
+    frappe.call({
+        method: "saturn.saturn.report.stock_balance_with_barcode_scanning_feature.stock_balance_with_barcode_scanning_feature.get_scanned_barcode_rows",
+        args: {
+            filters: query_report.get_filter_values(),
+            barcode: barcode,
+        },
+        callback: (r) => {
+            let { columns, rows } = r.message || { columns: [], rows: [] };
+            if (!rows.length) {
+                frappe.show_alert({ message: __("No Item found for this barcode."), indicator: "red" });
+            } else {
+                // أعمدة وحدة القياس الإضافية (include_uom) لا تظهر في جدول الجلسة الفارغ
+                if (columns.length !== query_report.columns.length) {
+                    query_report.columns = query_report.prepare_columns(columns);
+                }
+
+                query_report.scanned_barcodes.push(barcode);
+                query_report.data = (query_report.data || []).concat(rows);
+                query_report.toggle_nothing_to_show(false);
+                query_report.render_datatable();
+            }
+
+            refocus_barcode(query_report);
+        },
+    });
+}
+
+function refocus_barcode(query_report) {
+    // تفريغ حقل الباركود دون إعادة تشغيل التقرير ثم التركيز عليه للمسح التالي
+    let barcode_field = query_report.page.fields_dict["barcode"];
+    barcode_field.value = "";
+    barcode_field.$input.val("").focus();
+}
@@ -1,21 +1,36 @@
 # Copyright (c) 2025, Asofi and contributors
 # For license information, please see license.txt
 
+import hashlib
+import json
+from collections import deque
 from operator import itemgetter
 from typing import Any, TypedDict
 
 import frappe
 from frappe import _
-from frappe.query_builder import Order
-from frappe.query_builder.functions import Coalesce
+from frappe.query_builder import Case, Order
+from frappe.query_builder.functions import Abs, Coalesce, Max, Sum
 from frappe.utils import add_days, cint, date_diff, flt, getdate
-from frappe.utils.nestedset import get_descendants_of
 
 import erpnext
 from erpnext.stock.doctype.inventory_dimension.inventory_dimension import get_inventory_dimensions
 from erpnext.stock.doctype.warehouse.warehouse import apply_warehouse_filter
-from erpnext.stock.report.stock_ageing.stock_ageing import FIFOSlots, get_average_age
+from erpnext.stock.report.stock_ageing.stock_ageing import get_average_age
 from erpnext.stock.utils import add_additional_uom_columns
+from pypika import CustomFunction, Tuple
+from pypika.terms import LiteralValue
+
+from saturn.utils.batching import get_batches
+from saturn.utils.replica import read_from_replica
+
+Round = CustomFunction("ROUND", ["value", "precision"])
+
+# If more item-warehouse pairs than this need the row-by-row path, the fast path is dropped
+FALLBACK_PAIR_LIMIT = 1000
+
+# Cached results are keyed by the ledger watermark, the expiry only bounds Redis usage
+CACHE_EXPIRY = 6 * 60 * 60
 
 
 class StockBalanceFilter(TypedDict):
@@ -30,13 +45,75 @@ class StockBalanceFilter(TypedDict):
     show_stock_ageing_data: bool
     show_variant_attributes: bool
     barcode: str | None  # إضافة حقل الباركود إلى الفلاتر
+    scan_session: bool  # جلسة مسح: الصفوف تُضاف لكل باركود عبر get_scanned_barcode_rows
 
 
 SLEntry = dict[str, Any]
 
 
+@read_from_replica("replica_for_stock_balance_report")
 def execute(filters: StockBalanceFilter | None = None):
-    return StockBalanceReport(filters).run()
+    # In a scan session the grid starts empty and each scan appends its own rows
+    if filters and filters.get("scan_session"):
+        return StockBalanceReport(filters).get_columns(), []
+
+    # The watermark is read on the same connection as the data, so replica lag cannot
+    # cache old results under a new key
+    cache_key = get_cache_key(filters)
+    if (result := frappe.cache.get_value(cache_key)) is not None:
+        return result
+
+    result = StockBalanceReport(filters).run()
+
+    # A repost rewrites values of later entries without touching their `modified`,
+    # so results read while one is pending are not cached
+    if not is_repost_pending(filters):
+        frappe.cache.set_value(cache_key, result, expires_in_sec=CACHE_EXPIRY)
+
+    return result
+
+
+@frappe.whitelist()
+def get_scanned_barcode_rows(filters, barcode):
+    """Columns and rows of the item behind one scanned barcode, computed on their own
+    so a scan session costs one small indexed report per scan instead of a full rerun.
+    The columns carry the `include_uom` columns the empty session grid lacks."""
+    if not frappe.get_doc("Report", "Stock Balance With Barcode Scanning Feature").is_permitted():
+        frappe.throw(_("You don't have access to this report"), frappe.PermissionError)
+
+    filters = frappe._dict(frappe.parse_json(filters))
+    filters.update({"barcode": barcode, "scan_session": 0, "item_code": None})
+
+    columns, data = execute(filters)
+    return {"columns": columns, "rows": data}
+
+
+def get_cache_key(filters) -> str:
+    """Hash of the normalized filters plus the latest change of every doctype the
+    result is read from, so any new or cancelled entry, a finished repost, a new
+    checkpoint or an edited item or barcode produces a new key."""
+    watermark = frappe.db.sql("""
+        SELECT
+            (SELECT MAX(modified) FROM `tabStock Ledger Entry`),
+            (SELECT MAX(modified) FROM `tabStock Reservation Entry`),
+            (SELECT MAX(modified) FROM `tabClosing Stock Balance`),
+            (SELECT MAX(modified) FROM `tabItem`),
+            (SELECT MAX(modified) FROM `tabItem Barcode`),
+            (SELECT MAX(modified) FROM `tabRepost Item Valuation`)
+    """)[0]
+
+    normalized = {key: value for key, value in (filters or {}).items() if value not in (None, "", [], 0)}
+    payload = json.dumps([normalized, watermark, frappe.local.lang], sort_keys=True, default=str)
+
+    return f"saturn:stock_balance_with_barcode:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+def is_repost_pending(filters) -> bool:
+    conditions = {"status": ("in", ["Queued", "In Progress"]), "docstatus": 1}
+    if company := (filters or {}).get("company"):
+        conditions["company"] = company
+
+    return bool(frappe.db.exists("Repost Item Valuation", conditions))
 
 
 class StockBalanceReport:
@@ -48,7 +125,7 @@ class StockBalanceReport:
         self.start_from = None
         self.data = []
         self.columns = []
-        self.sle_entries: list[SLEntry] = []
+        self.fifo_slots = None
         self.set_company_currency()
 
     def set_company_currency(self) -> None:
@@ -58,12 +135,7 @@ class StockBalanceReport:
             self.company_currency = frappe.db.get_single_value("Global Defaults", "default_currency")
 
     def run(self):
-        self.float_precision = cint(frappe.db.get_default("float_precision")) or 3
-
-        self.inventory_dimensions = self.get_inventory_dimension_fields()
-        self.prepare_opening_data_from_closing_balance()
-        self.prepare_stock_ledger_entries()
-        self.prepare_new_data()
+        self.data = list(self.iter_data())
 
         if not self.columns:
             self.columns = self.get_columns()
@@ -72,6 +144,22 @@ class StockBalanceReport:
 
         return self.columns, self.data
 
+    def iter_data(self):
+        """Yield report rows one by one; exports write them out without keeping the list."""
+        self.float_precision = cint(frappe.db.get_default("float_precision")) or 3
+
+        self.inventory_dimensions = self.get_inventory_dimension_fields()
+        self.set_row_accessors()
+
+        self.barcode_items = self.get_barcode_items()
+        if self.barcode_items == []:
+            return
+
+        self.prepare_opening_data_from_closing_balance()
+        self.prepare_stock_ledger_entries()
+
+        yield from self.iter_new_data()
+
     def prepare_opening_data_from_closing_balance(self) -> None:
         self.opening_data = frappe._dict({})
 
@@ -89,34 +177,35 @@ class StockBalanceReport:
             if group_by_key not in self.opening_data:
                 self.opening_data.setdefault(group_by_key, entry)
 
-    def prepare_new_data(self):
+    def iter_new_data(self):
         self.item_warehouse_map = self.get_item_warehouse_map()
 
-        if self.filters.get("show_stock_ageing_data"):
-            self.filters["show_warehouse_wise_stock"] = True
-            item_wise_fifo_queue = FIFOSlots(self.filters, self.sle_entries).generate()
-
         _func = itemgetter(1)
 
-        del self.sle_entries
-
         sre_details = self.get_sre_reserved_qty_details()
 
         variant_values = {}
         if self.filters.get("show_variant_attributes"):
             variant_values = self.get_variant_values_for()
 
-        for _key, report_data in self.item_warehouse_map.items():
+        for _key, balance in self.item_warehouse_map.items():
+            if (
+                not self.filters.get("include_zero_stock_items")
+                and balance.bal_qty == 0
+                and balance.bal_val == 0
+            ):
+                continue
+
+            # القواميس تُبنى فقط للصفوف التي ستظهر في التقرير
+            report_data = balance.as_dict(self.company_currency, self.inventory_dimensions)
+
             if variant_data := variant_values.get(report_data.item_code):
                 report_data.update(variant_data)
 
             if self.filters.get("show_stock_ageing_data"):
                 opening_fifo_queue = self.get_opening_fifo_queue(report_data) or []
 
-                fifo_queue = []
-                if fifo_queue := item_wise_fifo_queue.get((report_data.item_code, report_data.warehouse)):
-                    fifo_queue = fifo_queue.get("fifo_queue")
-
+                fifo_queue = self.fifo_slots.get(report_data.item_code, report_data.warehouse)
                 if fifo_queue:
                     opening_fifo_queue.extend(fifo_queue)
 
@@ -138,81 +227,205 @@ class StockBalanceReport:
                 {"reserved_stock": sre_details.get((report_data.item_code, report_data.warehouse), 0.0)}
             )
 
-            if (
-                not self.filters.get("include_zero_stock_items")
-                and report_data
-                and report_data.bal_qty == 0
-                and report_data.bal_val == 0
-            ):
-                continue
-
-            self.data.append(report_data)
+            yield report_data
 
     def get_item_warehouse_map(self):
         item_warehouse_map = {}
         self.opening_vouchers = self.get_opening_vouchers()
 
+        # Stock ageing is computed in the same streamed pass, so memory follows the
+        # number of item-warehouse pairs instead of the number of ledger rows
         if self.filters.get("show_stock_ageing_data"):
-            self.sle_entries = self.sle_query.run(as_dict=True)
+            self.fifo_slots = StreamingFIFOSlots()
+
+        sle_query = self.sle_query
+        if self.can_aggregate_in_sql():
+            fallback_pairs = self.prepare_aggregated_item_warehouse_map(item_warehouse_map)
+
+            if len(fallback_pairs) > FALLBACK_PAIR_LIMIT:
+                item_warehouse_map.clear()
+            elif fallback_pairs:
+                sle_query = sle_query.where(
+                    Tuple(self.sle.item_code, self.sle.warehouse).isin([Tuple(*pair) for pair in fallback_pairs])
+                )
+            else:
+                sle_query = None
 
         # HACK: This is required to avoid causing db query in flt
         _system_settings = frappe.get_cached_doc("System Settings")
         with frappe.db.unbuffered_cursor():
-            if not self.filters.get("show_stock_ageing_data"):
-                self.sle_entries = self.sle_query.run(as_dict=True, as_iterator=True)
+            sle_entries = sle_query.run(as_dict=True, as_iterator=True) if sle_query else []
+
+            self.accumulate_entries(item_warehouse_map, sle_entries)
 
-            for entry in self.sle_entries:
-                group_by_key = self.get_group_by_key(entry)
-                if group_by_key not in item_warehouse_map:
-                    self.initialize_data(item_warehouse_map, group_by_key, entry)
+        for group_by_key, entry in self.opening_data.items():
+            if group_by_key not in item_warehouse_map:
+                self.initialize_data(item_warehouse_map, group_by_key, entry)
 
-                self.prepare_item_warehouse_map(item_warehouse_map, entry, group_by_key)
+        item_warehouse_map = filter_items_with_no_transactions(item_warehouse_map, self.float_precision)
 
-                if self.opening_data.get(group_by_key):
-                    del self.opening_data[group_by_key]
+        return item_warehouse_map
 
-        for group_by_key, entry in self.opening_data.items():
+    def set_row_accessors(self) -> None:
+        """Resolve once what the per-row loop would otherwise look up for every ledger row."""
+        self.group_by_dimensions = tuple(
+            fieldname for fieldname in self.inventory_dimensions if self.filters.get(fieldname)
+        )
+
+        self.get_dimension_values = None
+        if len(self.inventory_dimensions) == 1:
+            getter = itemgetter(self.inventory_dimensions[0])
+            self.get_dimension_values = lambda entry: (getter(entry),)
+        elif self.inventory_dimensions:
+            self.get_dimension_values = itemgetter(*self.inventory_dimensions)
+
+    def accumulate_entries(self, item_warehouse_map, sle_entries) -> None:
+        """The report's hot path, run once per ledger row."""
+        get_group_by_key = self.get_group_by_key
+        prepare_item_warehouse_map = self.prepare_item_warehouse_map
+        opening_data = self.opening_data
+        fifo_slots = self.fifo_slots
+
+        for entry in sle_entries:
+            group_by_key = get_group_by_key(entry)
             if group_by_key not in item_warehouse_map:
                 self.initialize_data(item_warehouse_map, group_by_key, entry)
 
-        item_warehouse_map = filter_items_with_no_transactions(
-            item_warehouse_map, self.float_precision, self.inventory_dimensions
+            qty_diff = prepare_item_warehouse_map(item_warehouse_map, entry, group_by_key)
+
+            if fifo_slots:
+                fifo_slots.update(entry, qty_diff)
+
+            if opening_data and group_by_key in opening_data:
+                del opening_data[group_by_key]
+
+    def can_aggregate_in_sql(self) -> bool:
+        """Balances can be summed by the database when no row needs the running
+        balance: no ageing and no grouping by inventory dimension. Pairs with Stock
+        Reconciliation rows or opening vouchers are detected per pair."""
+        if self.filters.get("show_stock_ageing_data"):
+            return False
+
+        return not any(self.filters.get(fieldname) for fieldname in self.inventory_dimensions)
+
+    def prepare_aggregated_item_warehouse_map(self, item_warehouse_map) -> list[tuple[str, str]]:
+        """Fill `item_warehouse_map` from one `GROUP BY company, item_code, warehouse`
+        query with conditional sums and return the (item_code, warehouse) pairs that
+        still need the row-by-row path."""
+        fallback_pairs = []
+
+        for row in self.get_aggregated_sle_query().run(as_dict=True):
+            if row.needs_rows:
+                fallback_pairs.append((row.item_code, row.warehouse))
+                continue
+
+            group_by_key = self.get_group_by_key(row)
+            self.initialize_data(item_warehouse_map, group_by_key, row)
+
+            qty_dict = item_warehouse_map[group_by_key]
+            if self.inventory_dimensions:
+                qty_dict.dimensions = tuple(row.get(field) or None for field in self.inventory_dimensions)
+
+            for field in ItemWarehouseBalance.TOTALS:
+                setattr(qty_dict, field, getattr(qty_dict, field) + flt(row[field]))
+
+            qty_dict.val_rate = flt(row.val_rate)
+
+        # opening_data is left intact: if the fallback limit drops these totals, the
+        # row-by-row path must still start every pair from its checkpoint balance
+        return fallback_pairs
+
+    def get_aggregated_sle_query(self):
+        sle = self.sle
+        item_table = frappe.qb.DocType("Item")
+
+        is_opening = sle.posting_date < self.from_date
+        is_in = (sle.posting_date >= self.from_date) & (Round(sle.actual_qty, self.float_precision) >= 0)
+        is_out = (sle.posting_date >= self.from_date) & (Round(sle.actual_qty, self.float_precision) < 0)
+
+        # صفوف تسوية المخزون تعتمد على الرصيد الجاري، وقيود الافتتاح داخل الفترة تُحتسب رصيداً افتتاحياً
+        needs_rows = Case().when(
+            (sle.voucher_type == "Stock Reconciliation")
+            & ((Coalesce(sle.batch_no, "") == "") | (Coalesce(sle.serial_no, "") != "")),
+            1,
         )
+        opening_vouchers = [name for names in self.opening_vouchers.values() for name in names]
+        if opening_vouchers:
+            needs_rows = needs_rows.when(sle.voucher_no.isin(opening_vouchers), 1)
 
-        return item_warehouse_map
+        query = (
+            frappe.qb.from_(sle)
+            .inner_join(item_table)
+            .on(sle.item_code == item_table.name)
+            .select(
+                sle.company,
+                sle.item_code,
+                sle.warehouse,
+                Max(item_table.item_group).as_("item_group"),
+                Max(item_table.stock_uom).as_("stock_uom"),
+                Max(item_table.item_name).as_("item_name"),
+                Sum(Case().when(is_opening, sle.actual_qty).else_(0)).as_("opening_qty"),
+                Sum(Case().when(is_opening, sle.stock_value_difference).else_(0)).as_("opening_val"),
+                Sum(Case().when(is_in, sle.actual_qty).else_(0)).as_("in_qty"),
+                Sum(Case().when(is_in, sle.stock_value_difference).else_(0)).as_("in_val"),
+                Sum(Case().when(is_out, Abs(sle.actual_qty)).else_(0)).as_("out_qty"),
+                Sum(Case().when(is_out, Abs(sle.stock_value_difference)).else_(0)).as_("out_val"),
+                Sum(sle.actual_qty).as_("bal_qty"),
+                Sum(sle.stock_value_difference).as_("bal_val"),
+                Max(needs_rows.else_(0)).as_("needs_rows"),
+                get_last_value("valuation_rate", "val_rate"),
+                *(get_last_value(fieldname) for fieldname in self.inventory_dimensions),
+            )
+            .where((sle.docstatus < 2) & (sle.is_cancelled == 0))
+            .groupby(sle.company, sle.item_code, sle.warehouse)
+        )
+
+        return self.apply_sle_filters(query, sle, item_table)
 
     def get_sre_reserved_qty_details(self) -> dict:
-        from erpnext.stock.doctype.stock_reservation_entry.stock_reservation_entry import (
-            get_sre_reserved_qty_for_items_and_warehouses as get_reserved_qty_details,
-        )
+        """Reserved qty of the result's item-warehouse pairs, read in bounded batches of
+        distinct pairs instead of two parallel IN lists with one entry per key."""
+        sre = frappe.qb.DocType("Stock Reservation Entry")
+        pairs = {(key[1], key[2]) for key in self.item_warehouse_map}
+
+        reserved_qty = {}
+        for batch in get_batches(pairs):
+            data = (
+                frappe.qb.from_(sre)
+                .select(sre.item_code, sre.warehouse, Sum(sre.reserved_qty - sre.delivered_qty).as_("reserved_qty"))
+                .where(
+                    (sre.docstatus == 1)
+                    & (sre.status.notin(["Delivered", "Cancelled"]))
+                    & Tuple(sre.item_code, sre.warehouse).isin([Tuple(*pair) for pair in batch])
+                )
+                .groupby(sre.item_code, sre.warehouse)
+            ).run(as_dict=True)
 
-        item_code_list, warehouse_list = [], []
-        for d in self.item_warehouse_map:
-            item_code_list.append(d[1])
-            warehouse_list.append(d[2])
+            reserved_qty.update({(d.item_code, d.warehouse): d.reserved_qty for d in data})
 
-        return get_reserved_qty_details(item_code_list, warehouse_list)
+        return reserved_qty
 
     def prepare_item_warehouse_map(self, item_warehouse_map, entry, group_by_key):
         qty_dict = item_warehouse_map[group_by_key]
-        for field in self.inventory_dimensions:
-            qty_dict[field] = entry.get(field)
+        if self.get_dimension_values:
+            qty_dict.dimensions = self.get_dimension_values(entry)
 
-        if entry.voucher_type == "Stock Reconciliation" and (not entry.batch_no or entry.serial_no):
-            qty_diff = flt(entry.qty_after_transaction) - flt(qty_dict.bal_qty)
+        # Numeric columns arrive as floats or NULL, so `or 0.0` replaces flt() here
+        voucher_type = entry.voucher_type
+        if voucher_type == "Stock Reconciliation" and (not entry.batch_no or entry.serial_no):
+            qty_diff = (entry.qty_after_transaction or 0.0) - qty_dict.bal_qty
         else:
-            qty_diff = flt(entry.actual_qty)
+            qty_diff = entry.actual_qty or 0.0
 
-        value_diff = flt(entry.stock_value_difference)
+        value_diff = entry.stock_value_difference or 0.0
+        posting_date = entry.posting_date
 
-        if entry.posting_date < self.from_date or entry.voucher_no in self.opening_vouchers.get(
-            entry.voucher_type, []
-        ):
+        if posting_date < self.from_date or entry.voucher_no in self.opening_vouchers.get(voucher_type, ()):
             qty_dict.opening_qty += qty_diff
             qty_dict.opening_val += value_diff
 
-        elif entry.posting_date >= self.from_date and entry.posting_date <= self.to_date:
-            if flt(qty_diff, self.float_precision) >= 0:
+        elif posting_date <= self.to_date:
+            if round(qty_diff, self.float_precision) >= 0:
                 qty_dict.in_qty += qty_diff
                 qty_dict.in_val += value_diff
             else:
@@ -223,39 +436,23 @@ class StockBalanceReport:
         qty_dict.bal_qty += qty_diff
         qty_dict.bal_val += value_diff
 
+        return qty_diff
+
     def initialize_data(self, item_warehouse_map, group_by_key, entry):
         opening_data = self.opening_data.get(group_by_key, {})
 
-        item_warehouse_map[group_by_key] = frappe._dict(
-            {
-                "item_code": entry.item_code,
-                "warehouse": entry.warehouse,
-                "item_group": entry.item_group,
-                "company": entry.company,
-                "currency": self.company_currency,
-                "stock_uom": entry.stock_uom,
-                "item_name": entry.item_name,
-                "opening_qty": opening_data.get("bal_qty") or 0.0,
-                "opening_val": opening_data.get("bal_val") or 0.0,
-                "opening_fifo_queue": opening_data.get("fifo_queue") or [],
-                "in_qty": 0.0,
-                "in_val": 0.0,
-                "out_qty": 0.0,
-                "out_val": 0.0,
-                "bal_qty": opening_data.get("bal_qty") or 0.0,
-                "bal_val": opening_data.get("bal_val") or 0.0,
-                "val_rate": 0.0,
-            }
+        item_warehouse_map[group_by_key] = ItemWarehouseBalance(
+            entry,
+            opening_qty=opening_data.get("bal_qty") or 0.0,
+            opening_val=opening_data.get("bal_val") or 0.0,
+            opening_fifo_queue=opening_data.get("fifo_queue") or [],
         )
 
     def get_group_by_key(self, row) -> tuple:
-        group_by_key = [row.company, row.item_code, row.warehouse]
-
-        for fieldname in self.inventory_dimensions:
-            if self.filters.get(fieldname):
-                group_by_key.append(row.get(fieldname))
+        if not self.group_by_dimensions:
+            return (row.company, row.item_code, row.warehouse)
 
-        return tuple(group_by_key)
+        return (row.company, row.item_code, row.warehouse, *(row.get(field) for field in self.group_by_dimensions))
 
     def get_closing_balance(self) -> list[dict[str, Any]]:
         if self.filters.get("ignore_closing_balance"):
@@ -269,30 +466,31 @@ class StockBalanceReport:
             .where(
                 (table.docstatus == 1)
                 & (table.company == self.filters.company)
-                & (table.to_date <= self.from_date)
+                & (table.to_date < self.from_date)
                 & (table.status == "Completed")
             )
             .orderby(table.to_date, order=Order.desc)
             .limit(1)
         )
 
+        # A checkpoint is only usable when its filters match exactly: a warehouse-wise
+        # checkpoint lacks other warehouses, and a company-wide one would add them
         for fieldname in ["warehouse", "item_code", "item_group", "warehouse_type"]:
             if self.filters.get(fieldname):
                 query = query.where(table[fieldname] == self.filters.get(fieldname))
+            else:
+                query = query.where(Coalesce(table[fieldname], "") == "")
 
         return query.run(as_dict=True)
 
     def prepare_stock_ledger_entries(self):
-        sle = frappe.qb.DocType("Stock Ledger Entry")
+        self.sle = sle = frappe.qb.DocType("Stock Ledger Entry")
         item_table = frappe.qb.DocType("Item")
-        item_barcode_table = frappe.qb.DocType("Item Barcode")  # Corrected doctype name
 
         query = (
             frappe.qb.from_(sle)
             .inner_join(item_table)
             .on(sle.item_code == item_table.name)
-            .left_join(item_barcode_table)  # Use LEFT JOIN
-            .on(item_table.name == item_barcode_table.parent)  # Join with parent
             .select(
                 sle.item_code,
                 sle.warehouse,
@@ -321,6 +519,9 @@ class StockBalanceReport:
         )
 
         query = self.apply_inventory_dimensions_filters(query, sle)
+        self.sle_query = self.apply_sle_filters(query, sle, item_table)
+
+    def apply_sle_filters(self, query, sle, item_table):
         query = self.apply_warehouse_filters(query, sle)
         query = self.apply_items_filters(query, item_table)
         query = self.apply_date_filters(query, sle)
@@ -328,11 +529,23 @@ class StockBalanceReport:
         if self.filters.get("company"):
             query = query.where(sle.company == self.filters.get("company"))
 
-        # Add barcode filter using the child table
-        if self.filters.get("barcode"):
-            query = query.where(item_barcode_table.barcode == self.filters.get("barcode"))
+        # فلتر الباركود محلول مسبقاً إلى أكواد الأصناف فيكون البحث عبر فهرس item_code
+        if self.barcode_items:
+            query = query.where(sle.item_code.isin(self.barcode_items))
+
+        return query
+
+    def get_barcode_items(self) -> list[str] | None:
+        """Resolve the barcode filter to item codes through the indexed `Item Barcode.barcode`."""
+        if not self.filters.get("barcode"):
+            return None
 
-        self.sle_query = query
+        return frappe.get_all(
+            "Item Barcode",
+            filters={"barcode": self.filters.get("barcode"), "parenttype": "Item"},
+            pluck="parent",
+            distinct=True,
+        )
 
     def apply_inventory_dimensions_filters(self, query, sle) -> str:
         inventory_dimension_fields = self.get_inventory_dimension_fields()
@@ -360,8 +573,14 @@ class StockBalanceReport:
 
     def apply_items_filters(self, query, item_table) -> str:
         if item_group := self.filters.get("item_group"):
-            children = get_descendants_of("Item Group", item_group, ignore_permissions=True)
-            query = query.where(item_table.item_group.isin([*children, item_group]))
+            # نطاق lft/rgt للمجموعة بدلاً من قائمة IN بكل المجموعات الفرعية
+            lft, rgt = frappe.db.get_value("Item Group", item_group, ["lft", "rgt"]) or (0, 0)
+            item_group_table = frappe.qb.DocType("Item Group")
+            query = (
+                query.inner_join(item_group_table)
+                .on(item_table.item_group == item_group_table.name)
+                .where((item_group_table.lft >= lft) & (item_group_table.rgt <= rgt))
+            )
 
         for field in ["item_code", "brand"]:
             if not self.filters.get(field):
@@ -522,54 +741,53 @@ class StockBalanceReport:
         add_additional_uom_columns(self.columns, self.data, self.filters.include_uom, conversion_factors)
 
     def get_itemwise_conversion_factor(self):
-        items = []
-        if self.filters.item_code or self.filters.item_group:
-            items = [d.item_code for d in self.data]
-
         table = frappe.qb.DocType("UOM Conversion Detail")
-        query = (
-            frappe.qb.from_(table)
-            .select(
-                table.conversion_factor,
-                table.parent,
-            )
-            .where((table.parenttype == "Item") & (table.uom == self.filters.include_uom))
-        )
+        conversion_factors = {}
+
+        # Only the items in the result, in bounded batches, even without an item filter
+        for items in get_batches({d.item_code for d in self.data}):
+            result = (
+                frappe.qb.from_(table)
+                .select(
+                    table.conversion_factor,
+                    table.parent,
+                )
+                .where(
+                    (table.parenttype == "Item")
+                    & (table.uom == self.filters.include_uom)
+                    & (table.parent.isin(items))
+                )
+            ).run(as_dict=1)
 
-        if items:
-            query = query.where(table.parent.isin(items))
+            conversion_factors.update({d.parent: d.conversion_factor for d in result})
 
-        result = query.run(as_dict=1)
-        if not result:
-            return {}
+        # Items without the UOM convert at 1, so every run, including a single scanned
+        # item, gets the same converted columns
+        for d in self.data:
+            conversion_factors.setdefault(d.item_code, 1.0)
 
-        return {d.parent: d.conversion_factor for d in result}
+        return conversion_factors
 
     def get_variant_values_for(self):
         """Returns variant values for items."""
         attribute_map = {}
-        items = []
-        if self.filters.item_code or self.filters.item_group:
-            items = [d.item_code for d in self.data]
-
-        filters = {}
-        if items:
-            filters = {"parent": ("in", items)}
-
-        attribute_info = frappe.get_all(
-            "Item Variant Attribute",
-            fields=["parent", "attribute", "attribute_value"],
-            filters=filters,
-        )
 
-        for attr in attribute_info:
-            attribute_map.setdefault(attr["parent"], {})
-            attribute_map[attr["parent"]].update({attr["attribute"]: attr["attribute_value"]})
+        # Rows are still being built here, so the items come from the aggregated keys
+        for items in get_batches({key[1] for key in self.item_warehouse_map}):
+            attribute_info = frappe.get_all(
+                "Item Variant Attribute",
+                fields=["parent", "attribute", "attribute_value"],
+                filters={"parent": ("in", items), "parenttype": "Item"},
+            )
+
+            for attr in attribute_info:
+                attribute_map.setdefault(attr["parent"], {})
+                attribute_map[attr["parent"]].update({attr["attribute"]: attr["attribute_value"]})
 
         return attribute_map
 
     def get_opening_vouchers(self):
-        opening_vouchers = {"Stock Entry": [], "Stock Reconciliation": []}
+        opening_vouchers = {"Stock Entry": set(), "Stock Reconciliation": set()}
 
         se = frappe.qb.DocType("Stock Entry")
         sr = frappe.qb.DocType("Stock Reconciliation")
@@ -595,7 +813,7 @@ class StockBalanceReport:
 
         if vouchers_data:
             for d in vouchers_data:
-                opening_vouchers[d.voucher_type].append(d.name)
+                opening_vouchers[d.voucher_type].add(d.name)
 
         return opening_vouchers
 
@@ -612,37 +830,158 @@ class StockBalanceReport:
         return opening_fifo_queue
 
 
-def filter_items_with_no_transactions(
-    iwb_map, float_precision: float, inventory_dimensions: list | None = None
-):
-    pop_keys = []
-    for group_by_key in iwb_map:
-        qty_dict = iwb_map[group_by_key]
+class StreamingFIFOSlots:
+    """FIFO stock ageing queues built one ledger row at a time.
 
-        no_transactions = True
-        for key, val in qty_dict.items():
-            if inventory_dimensions and key in inventory_dimensions:
-                continue
+    A streaming take on ERPNext's `FIFOSlots`: each item-warehouse pair keeps a
+    deque of `(qty, posting_date)` tuples. Slots consumed by an outgoing row are
+    held only until the voucher changes, to give incoming rows of the same voucher
+    (e.g. Repack) their original age. Serial numbers are aged by quantity like any
+    other stock instead of being tracked one by one.
+    """
+
+    __slots__ = ("queues", "transferred", "voucher")
+
+    def __init__(self):
+        self.queues = {}
+        self.transferred = {}
+        self.voucher = None
+
+    def get(self, item_code, warehouse):
+        return list(self.queues.get((item_code, warehouse), ()))
+
+    def update(self, entry, qty):
+        voucher = (entry.voucher_type, entry.voucher_no)
+        if voucher != self.voucher:
+            self.voucher = voucher
+            self.transferred.clear()
+
+        if not qty:
+            return
+
+        key = (entry.item_code, entry.warehouse)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+
+        if qty > 0:
+            self.add_incoming(queue, qty, entry.posting_date, self.transferred.get(key))
+        else:
+            self.consume(queue, -qty, entry.posting_date, self.transferred.setdefault(key, deque()))
+
+    def add_incoming(self, queue, qty, posting_date, transferred):
+        while qty > 0:
+            if transferred:
+                slot_qty, slot_date = transferred[0]
+                if slot_qty <= qty:
+                    transferred.popleft()
+                else:
+                    transferred[0] = (slot_qty - qty, slot_date)
+                    slot_qty = qty
+
+                if slot_qty <= 0:
+                    continue
+            else:
+                slot_qty, slot_date = qty, posting_date
+
+            qty -= slot_qty
+            self.add_slot(queue, slot_qty, slot_date)
+
+    @staticmethod
+    def add_slot(queue, qty, posting_date):
+        # neutralize 0/negative stock by adding positive stock
+        if queue and queue[0][0] <= 0:
+            queue[0] = (queue[0][0] + qty, posting_date)
+        else:
+            queue.append((qty, posting_date))
+
+    @staticmethod
+    def consume(queue, qty, posting_date, transferred):
+        while qty > 0:
+            if not queue:
+                # negative stock, no balance but qty yet to consume
+                queue.append((-qty, posting_date))
+                transferred.append((qty, posting_date))
+                return
+
+            slot_qty, slot_date = queue[0]
+            if 0 < slot_qty <= qty:
+                queue.popleft()
+                transferred.append((slot_qty, slot_date))
+                qty -= slot_qty
+            else:
+                queue[0] = (slot_qty - qty, slot_date)
+                transferred.append((qty, slot_date))
+                return
 
-            if key in [
-                "item_code",
-                "warehouse",
-                "item_name",
-                "item_group",
-                "project",
-                "stock_uom",
-                "company",
-                "opening_fifo_queue",
-            ]:
-                continue
 
-            val = flt(val, float_precision)
-            qty_dict[key] = val
-            if key != "val_rate" and val:
-                no_transactions = False
+class ItemWarehouseBalance:
+    """Running totals of one item-warehouse key.
 
-        if no_transactions:
-            pop_keys.append(group_by_key)
+    A slotted object instead of an 18-key `frappe._dict` per key; the report row
+    dict is only built by `as_dict` for keys that are actually returned.
+    """
+
+    TOTALS = ("opening_qty", "opening_val", "in_qty", "in_val", "out_qty", "out_val", "bal_qty", "bal_val")
+
+    __slots__ = (
+        "item_code", "warehouse", "item_group", "company", "stock_uom", "item_name",
+        "opening_fifo_queue", "dimensions", "val_rate", *TOTALS,
+    )
+
+    def __init__(self, entry, opening_qty=0.0, opening_val=0.0, opening_fifo_queue=None):
+        self.item_code = entry.item_code
+        self.warehouse = entry.warehouse
+        self.item_group = entry.item_group
+        self.company = entry.company
+        self.stock_uom = entry.stock_uom
+        self.item_name = entry.item_name
+        self.opening_fifo_queue = opening_fifo_queue or []
+        self.dimensions = None
+
+        self.opening_qty = self.bal_qty = opening_qty
+        self.opening_val = self.bal_val = opening_val
+        self.in_qty = self.in_val = self.out_qty = self.out_val = self.val_rate = 0.0
+
+    def round_values(self, precision) -> bool:
+        """Round all totals in place and return whether any of them is non-zero."""
+        self.val_rate = flt(self.val_rate, precision)
+
+        has_transactions = False
+        for field in self.TOTALS:
+            value = flt(getattr(self, field), precision)
+            setattr(self, field, value)
+            has_transactions = has_transactions or bool(value)
+
+        return has_transactions
+
+    def as_dict(self, currency, inventory_dimensions=None):
+        row = frappe._dict(
+            {
+                "item_code": self.item_code,
+                "warehouse": self.warehouse,
+                "item_group": self.item_group,
+                "company": self.company,
+                "currency": currency,
+                "stock_uom": self.stock_uom,
+                "item_name": self.item_name,
+                "opening_fifo_queue": self.opening_fifo_queue,
+                "val_rate": self.val_rate,
+            }
+        )
+
+        for field in self.TOTALS:
+            row[field] = getattr(self, field)
+
+        if self.dimensions:
+            row.update(zip(inventory_dimensions, self.dimensions))
+
+        return row
+
+
+def filter_items_with_no_transactions(iwb_map, float_precision: float):
+    """Round every key's totals and drop the keys whose totals are all zero."""
+    pop_keys = [key for key, balance in iwb_map.items() if not balance.round_values(float_precision)]
 
     for key in pop_keys:
         iwb_map.pop(key)
@@ -650,6 +989,19 @@ def filter_items_with_no_transactions(
     return iwb_map
 
 
+def get_last_value(fieldname, alias=None):
+    """Value of `fieldname` on the last ledger row of each group, in the row path's order."""
+    column = f"`tabStock Ledger Entry`.`{fieldname}`"
+    order = ", ".join(
+        f"`tabStock Ledger Entry`.`{field}` DESC" for field in ("posting_datetime", "creation", "actual_qty")
+    )
+
+    return LiteralValue(
+        f"SUBSTRING_INDEX(GROUP_CONCAT(IFNULL({column}, '') ORDER BY {order} SEPARATOR '\\n'), '\\n', 1)",
+        alias=alias or fieldname,
+    )
+
+
 def get_variants_attributes() -> list[str]:
     """Return all item variant attributes."""
     return frappe.get_all("Item Attribute", pluck="name")
\ No newline at end of file
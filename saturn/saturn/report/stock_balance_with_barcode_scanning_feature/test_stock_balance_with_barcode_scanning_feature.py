@@ -0,0 +1,133 @@
+# Copyright (c) 2026, Asofi and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from erpnext.stock.report.stock_ageing.stock_ageing import FIFOSlots, get_average_age
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, flt, getdate
+
+from saturn.saturn.report.stock_balance_with_barcode_scanning_feature import (
+	stock_balance_with_barcode_scanning_feature as report_module,
+)
+
+COMPANY = "_Test Company"
+ITEM = "_Test Item"
+
+
+class StaticQuery:
+	"""Stands in for a built query; returns fixed rows and ignores extra conditions."""
+
+	def __init__(self, rows):
+		self.rows = rows
+
+	def where(self, *args, **kwargs):
+		return self
+
+	def run(self, as_dict=False, as_iterator=False):
+		return iter(self.rows) if as_iterator else list(self.rows)
+
+
+def make_row(warehouse, **kwargs):
+	return frappe._dict(
+		{
+			"company": COMPANY,
+			"item_code": ITEM,
+			"warehouse": warehouse,
+			"item_group": "_Test Item Group",
+			"item_name": ITEM,
+			"stock_uom": "_Test UOM",
+			**kwargs,
+		}
+	)
+
+
+class TestStockBalanceWithBarcodeScanningFeature(FrappeTestCase):
+	def test_fallback_limit_keeps_closing_balance_opening(self):
+		report = report_module.StockBalanceReport(
+			frappe._dict(company=COMPANY, from_date="2026-02-01", to_date="2026-02-28")
+		)
+		report.float_precision = 3
+		report.inventory_dimensions = []
+		report.set_row_accessors()
+		report.get_opening_vouchers = lambda: {}
+
+		checkpoint_key = (COMPANY, ITEM, "Stores - _TC")
+		report.opening_data = frappe._dict({checkpoint_key: frappe._dict(bal_qty=10.0, bal_val=100.0)})
+
+		# the checkpoint pair aggregates in SQL, the other two need the row path
+		aggregated = [
+			make_row(
+				"Stores - _TC", needs_rows=0, opening_qty=0, opening_val=0, in_qty=5, in_val=50,
+				out_qty=0, out_val=0, bal_qty=5, bal_val=50, val_rate=10,
+			),
+			make_row("Finished Goods - _TC", needs_rows=1),
+			make_row("Work In Progress - _TC", needs_rows=1),
+		]
+		ledger = [
+			make_row(
+				warehouse, voucher_type="Stock Entry", voucher_no="STE-TEST", posting_date=getdate("2026-02-10"),
+				actual_qty=5.0, stock_value_difference=50.0, valuation_rate=10.0, batch_no=None, serial_no=None,
+			)
+			for warehouse in ("Stores - _TC", "Finished Goods - _TC", "Work In Progress - _TC")
+		]
+		report.get_aggregated_sle_query = lambda: StaticQuery(aggregated)
+		report.sle_query = StaticQuery(ledger)
+
+		with patch.object(report_module, "FALLBACK_PAIR_LIMIT", 1):
+			item_warehouse_map = report.get_item_warehouse_map()
+
+		balance = item_warehouse_map[checkpoint_key]
+		self.assertEqual(balance.opening_qty, 10.0)
+		self.assertEqual(balance.in_qty, 5.0)
+		self.assertEqual(balance.bal_qty, 15.0)
+		self.assertEqual(balance.bal_val, 150.0)
+
+	def test_streaming_fifo_slots_match_erpnext(self):
+		start = getdate("2026-01-01")
+		ledger = [
+			# voucher, item, warehouse, qty, day
+			("MR-1", ITEM, "Stores - _TC", 10, 0),
+			("MR-2", ITEM, "Stores - _TC", 5, 3),
+			("MI-1", ITEM, "Stores - _TC", -12, 5),
+			# Repack-style voucher: the same item leaves and re-enters the warehouse
+			("RP-1", ITEM, "Stores - _TC", -2, 8),
+			("RP-1", ITEM, "Stores - _TC", 2, 8),
+			("RP-1", "_Test Item 2", "Stores - _TC", 3, 8),
+			# transfer into negative stock, then a receipt that neutralizes it
+			("MT-1", ITEM, "Stores - _TC", -4, 10),
+			("MT-1", ITEM, "Finished Goods - _TC", 4, 10),
+			("MR-3", ITEM, "Stores - _TC", 6, 12),
+			("MI-2", ITEM, "Finished Goods - _TC", -1, 15),
+		]
+
+		balances = {}
+		entries = []
+		for voucher_no, item_code, warehouse, qty, day in ledger:
+			key = (item_code, warehouse)
+			balances[key] = balances.get(key, 0) + qty
+			entries.append(
+				frappe._dict(
+					name=item_code, item_code=item_code, warehouse=warehouse, voucher_type="Stock Entry",
+					voucher_no=voucher_no, actual_qty=qty, posting_date=add_days(start, day),
+					qty_after_transaction=balances[key], stock_value_difference=qty * 10, valuation_rate=10,
+					serial_no=None, has_serial_no=0, serial_and_batch_bundle=None,
+				)
+			)
+
+		streaming = report_module.StreamingFIFOSlots()
+		for entry in entries:
+			streaming.update(entry, entry.actual_qty)
+
+		expected = FIFOSlots(
+			frappe._dict(show_warehouse_wise_stock=True), [frappe._dict(entry) for entry in entries]
+		).generate()
+
+		to_date = add_days(start, 30)
+		for key, details in expected.items():
+			expected_queue = [(flt(slot[0]), getdate(slot[1])) for slot in details["fifo_queue"]]
+			queue = [(flt(qty), getdate(posting_date)) for qty, posting_date in streaming.get(*key)]
+
+			self.assertEqual(queue, expected_queue, key)
+			self.assertEqual(get_average_age(queue, to_date), get_average_age(expected_queue, to_date), key)
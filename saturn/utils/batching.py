@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+BATCH_SIZE = 1000
+
+
+def get_batches(values, size=BATCH_SIZE):
+    """Split `values` into lists of at most `size` items, to bound IN clauses and
+    multi-row statements."""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""Synthetic-data benchmarks for the reorder engine and reorder documents.
+
+Seed a local test site, then time the entry points and write a JSON artifact
+that can be compared between commits:
+
+    bench --site test.local execute saturn.utils.benchmark.seed \\
+        --kwargs "{'items': 10000, 'warehouses': 20, 'sle_rows': 5000000}"
+    bench --site test.local execute saturn.utils.benchmark.run \\
+        --kwargs "{'output': '/tmp/saturn-benchmark.json'}"
+    bench --site test.local execute saturn.utils.benchmark.report_loop \\
+        --kwargs "{'rows': 1000000}"
+    bench --site test.local execute saturn.utils.benchmark.clear
+
+Only sites with `allow_tests` or `developer_mode` enabled are accepted.
+"""
+import json
+import random
+import tracemalloc
+from time import perf_counter
+
+import frappe
+from frappe.utils import add_days, cint, getdate, now, today
+
+from saturn.utils.instrumentation import PhaseTimer
+
+PREFIX = "SBM"
+ITEM_GROUP = "Saturn Benchmark"
+PROFILE = "Saturn Benchmark"
+INSERT_BATCH = 50_000
+
+
+def seed(items=10_000, warehouses=20, sle_rows=5_000_000, days=365, seed_value=42):
+    """Create benchmark Items, Warehouses, Bins and Stock Ledger Entries."""
+    check_site()
+    random.seed(seed_value)
+
+    company = get_company()
+    parent_warehouse = make_warehouses(company, cint(warehouses))
+    warehouse_names = frappe.get_all("Warehouse", filters={"parent_warehouse": parent_warehouse}, pluck="name")
+
+    item_codes = make_items(cint(items))
+    make_bins(item_codes, warehouse_names)
+    make_stock_ledger_entries(company, item_codes, warehouse_names, cint(sle_rows), cint(days))
+    make_reorder_profile(warehouse_names[0], cint(days))
+
+    frappe.db.commit()
+    print(f"Seeded {len(item_codes)} items, {len(warehouse_names)} warehouses and {sle_rows} ledger rows")
+
+
+def run(output=None):
+    """Time the reorder entry points and write the results as JSON."""
+    check_site()
+
+    from saturn.utils.consumption_store import update_consumption_store
+    from saturn.utils.inventory_engine import update_reorder_levels
+
+    item_codes = frappe.get_all("Item", filters={"item_group": ITEM_GROUP}, pluck="name", order_by="name")
+    if not item_codes:
+        frappe.throw("No benchmark data found, run saturn.utils.benchmark.seed first")
+
+    parent_warehouse = frappe.db.get_value("Warehouse", {"warehouse_name": f"{PREFIX} Stores", "is_group": 1})
+    request_for = frappe.db.get_value("Warehouse", {"parent_warehouse": parent_warehouse})
+
+    results = {
+        "timestamp": now(),
+        "site": frappe.local.site,
+        "volumes": get_volumes(item_codes),
+        "benchmarks": {}
+    }
+
+    def record(name, fn, commit=False):
+        results["benchmarks"][name] = measure(fn)
+        if commit:
+            frappe.db.commit()
+        else:
+            frappe.db.rollback()
+        print(f"{name}: {json.dumps(results['benchmarks'][name])}")
+
+    def make_schedule():
+        return frappe.get_doc({
+            "doctype": "Processing Automatic Item Requests",
+            "item_group": ITEM_GROUP,
+            "from_date": add_days(today(), -30),
+            "to_date": today(),
+            "check_in_group": parent_warehouse,
+            "request_for": request_for,
+            "material_request_type": "Purchase"
+        })
+
+    # Without a watermark the store is rebuilt from scratch; the second call measures the delta path
+    frappe.db.set_single_value("Saturn Settings", "consumption_watermark", None)
+    record("consumption_store.rebuild", update_consumption_store, commit=True)
+    record("consumption_store.update", update_consumption_store, commit=True)
+    record("inventory_engine.update_reorder_levels", lambda: update_reorder_levels(item_codes, PROFILE))
+
+    # set_items is the work get_items hands to a background job above BACKGROUND_JOB_ROWS
+    record("processing_automatic_item_requests.set_items", make_schedule().set_items)
+
+    schedule = make_schedule()
+    schedule.set_items()
+    for row in schedule.automated_item_request_processing_schedule:
+        row.warehouse_reorder_level = row.warehouse_reorder_qty = random.randint(1, 100)
+    record("processing_automatic_item_requests.add_reorder_levels_to_items", schedule.add_reorder_levels_to_items)
+
+    results["benchmarks"]["stock_balance_report.accumulate_entries"] = report_loop(rows=200_000)
+
+    output = output or frappe.get_site_path("saturn_benchmark.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=1, default=str)
+
+    print(f"Results written to {output}")
+    return results
+
+
+def report_loop(rows=1_000_000, pairs=10_000, days=365, seed_value=42):
+    """Push synthetic ledger rows through the stock balance report's per-row loop
+    and return its throughput; no ledger data is read or written."""
+    from saturn.saturn.report.stock_balance_with_barcode_scanning_feature.stock_balance_with_barcode_scanning_feature import (
+        StockBalanceReport,
+    )
+
+    random.seed(seed_value)
+    rows, pairs, days = cint(rows), cint(pairs), cint(days)
+
+    to_date = getdate(today())
+    from_date = getdate(add_days(to_date, -(days // 2)))
+    company = get_company()
+
+    report = StockBalanceReport(frappe._dict(company=company, from_date=from_date, to_date=to_date))
+    report.float_precision = 3
+    report.inventory_dimensions = report.get_inventory_dimension_fields()
+    report.set_row_accessors()
+    report.opening_data = frappe._dict()
+    report.opening_vouchers = {"Stock Entry": set(), "Stock Reconciliation": set()}
+
+    keys = [(f"{PREFIX}-ITEM-{i % 5000:06d}", f"{PREFIX} Store {i % 20:03d}") for i in range(pairs)]
+    entries = []
+    for i in range(rows):
+        item_code, warehouse = random.choice(keys)
+        qty = random.choice((-1, -1, -1, 1)) * random.randint(1, 20)
+        entry = frappe._dict(
+            item_code=item_code, warehouse=warehouse, company=company,
+            posting_date=add_days(to_date, -random.randint(0, days)),
+            actual_qty=float(qty), qty_after_transaction=0.0, stock_value_difference=float(qty * 10),
+            valuation_rate=10.0, voucher_type="Stock Entry", voucher_no=f"{PREFIX}-SE-{i // 10:08d}",
+            batch_no=None, serial_no=None, item_group=ITEM_GROUP, stock_uom="Nos", item_name=item_code
+        )
+        entry.update(dict.fromkeys(report.inventory_dimensions))
+        entries.append(entry)
+
+    start = perf_counter()
+    report.accumulate_entries({}, entries)
+    elapsed = perf_counter() - start
+
+    result = {
+        "rows": rows,
+        "pairs": pairs,
+        "wall_time": round(elapsed, 4),
+        "rows_per_second": round(rows / elapsed) if elapsed else None
+    }
+    print(f"stock_balance_report.accumulate_entries: {json.dumps(result)}")
+    return result
+
+
+def measure(fn):
+    """Return wall time, SQL query count and peak Python memory of `fn()`."""
+    timer = PhaseTimer()
+    tracemalloc.start()
+    start = perf_counter()
+
+    try:
+        with timer:
+            fn()
+    finally:
+        wall_time = perf_counter() - start
+        _current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "wall_time": round(wall_time, 4),
+        "query_count": timer.query_count,
+        "peak_memory_mb": round(peak / (1024 * 1024), 2)
+    }
+
+
+def clear():
+    """Delete everything created by `seed`."""
+    check_site()
+
+    item_codes = frappe.get_all("Item", filters={"item_group": ITEM_GROUP}, pluck="name")
+    for batch in (item_codes[i:i + 1000] for i in range(0, len(item_codes), 1000)):
+        for doctype, field in (
+            ("Stock Ledger Entry", "item_code"),
+            ("Bin", "item_code"),
+            ("Saturn Daily Consumption", "item_code"),
+            ("Item Reorder", "parent"),
+            ("Item", "name"),
+        ):
+            frappe.db.delete(doctype, {field: ("in", batch)})
+
+    frappe.db.delete("Processing Automatic Item Requests", {"item_group": ITEM_GROUP})
+    frappe.db.delete("Saturn Reorder Profile", {"name": PROFILE})
+    for warehouse in frappe.get_all("Warehouse", filters={"warehouse_name": ("like", f"{PREFIX} %")},
+                                    pluck="name", order_by="lft desc"):
+        frappe.delete_doc("Warehouse", warehouse, force=True, ignore_permissions=True)
+
+    frappe.db.commit()
+
+
+def check_site():
+    if not (frappe.conf.allow_tests or frappe.conf.developer_mode):
+        frappe.throw("Benchmarks seed synthetic data and only run on sites with allow_tests or developer_mode")
+
+
+def get_company():
+    return frappe.defaults.get_global_default("company") or frappe.get_all("Company", pluck="name", limit=1)[0]
+
+
+def get_volumes(item_codes):
+    warehouses = {w for w, in frappe.db.sql("SELECT DISTINCT warehouse FROM `tabBin` WHERE item_code = %s",
+                                            item_codes[0])}
+    return {
+        "items": len(item_codes),
+        "warehouses": len(warehouses),
+        "stock_ledger_entries": frappe.db.count("Stock Ledger Entry", {"voucher_no": ("like", f"{PREFIX}-%")}),
+    }
+
+
+def make_warehouses(company, count):
+    parent = frappe.db.get_value("Warehouse", {"warehouse_name": f"{PREFIX} Stores", "company": company})
+    if not parent:
+        parent = frappe.get_doc({
+            "doctype": "Warehouse",
+            "warehouse_name": f"{PREFIX} Stores",
+            "company": company,
+            "is_group": 1
+        }).insert(ignore_permissions=True).name
+
+    for i in range(1, count + 1):
+        warehouse_name = f"{PREFIX} Store {i:03d}"
+        if not frappe.db.exists("Warehouse", {"warehouse_name": warehouse_name, "company": company}):
+            frappe.get_doc({
+                "doctype": "Warehouse",
+                "warehouse_name": warehouse_name,
+                "company": company,
+                "parent_warehouse": parent
+            }).insert(ignore_permissions=True)
+
+    return parent
+
+
+def make_items(count):
+    if not frappe.db.exists("Item Group", ITEM_GROUP):
+        frappe.get_doc({
+            "doctype": "Item Group",
+            "item_group_name": ITEM_GROUP,
+            "parent_item_group": "All Item Groups"
+        }).insert(ignore_permissions=True)
+
+    timestamp, user = now(), frappe.session.user
+    item_codes = [f"{PREFIX}-ITEM-{i:06d}" for i in range(1, count + 1)]
+    existing = set(frappe.get_all("Item", filters={"item_group": ITEM_GROUP}, pluck="name"))
+
+    frappe.db.bulk_insert(
+        "Item",
+        fields=["name", "item_code", "item_name", "item_group", "stock_uom", "is_stock_item",
+                "is_smart_reorder", "disabled", "creation", "modified", "owner", "modified_by"],
+        values=[
+            (code, code, code, ITEM_GROUP, "Nos", 1, 1, 0, timestamp, timestamp, user, user)
+            for code in item_codes if code not in existing
+        ],
+        chunk_size=INSERT_BATCH
+    )
+
+    return item_codes
+
+
+def make_bins(item_codes, warehouses):
+    frappe.db.bulk_insert(
+        "Bin",
+        fields=["name", "item_code", "warehouse", "actual_qty", "projected_qty", "stock_uom"],
+        values=[
+            (frappe.generate_hash(length=12), item_code, warehouse, qty, qty, "Nos")
+            for item_code in item_codes
+            for warehouse in warehouses
+            for qty in (random.randint(0, 500),)
+        ],
+        ignore_duplicates=True,
+        chunk_size=INSERT_BATCH
+    )
+
+
+def make_stock_ledger_entries(company, item_codes, warehouses, count, days):
+    fields = [
+        "name", "item_code", "warehouse", "posting_date", "posting_time", "posting_datetime",
+        "actual_qty", "qty_after_transaction", "valuation_rate", "stock_value", "stock_value_difference",
+        "company", "voucher_type", "voucher_no", "stock_uom", "is_cancelled", "docstatus",
+        "creation", "modified", "owner", "modified_by"
+    ]
+    start_date = getdate(add_days(today(), -days))
+    timestamp, user = now(), frappe.session.user
+
+    for offset in range(0, count, INSERT_BATCH):
+        values = []
+        for i in range(offset, min(offset + INSERT_BATCH, count)):
+            posting_date = add_days(start_date, random.randint(0, days))
+            qty = random.choice((-1, -1, -1, 1)) * random.randint(1, 20)
+            rate = random.randint(1, 1000)
+            values.append((
+                f"{PREFIX}-SLE-{i:09d}", random.choice(item_codes), random.choice(warehouses),
+                posting_date, "12:00:00", f"{posting_date} 12:00:00",
+                qty, 0, rate, 0, qty * rate,
+                company, "Stock Entry", f"{PREFIX}-SE-{i // 10:08d}", "Nos", 0, 1,
+                timestamp, timestamp, user, user
+            ))
+
+        frappe.db.bulk_insert("Stock Ledger Entry", fields=fields, values=values,
+                              ignore_duplicates=True, chunk_size=INSERT_BATCH)
+        frappe.db.commit()
+
+
+def make_reorder_profile(warehouse, days):
+    if frappe.db.exists("Saturn Reorder Profile", PROFILE):
+        return
+
+    frappe.get_doc({
+        "doctype": "Saturn Reorder Profile",
+        "profile_name": PROFILE,
+        "analysis_period": days,
+        "coverage_months": 1,
+        "safety_stock_percent": 20,
+        "default_warehouse": warehouse
+    }).insert(ignore_permissions=True)
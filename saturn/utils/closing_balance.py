@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import frappe
+from frappe.utils import add_months, cint, get_first_day, get_last_day, today
+
+
+def create_monthly_closing_balances():
+    """Create last month's `Closing Stock Balance` checkpoints.
+
+    One company-wide checkpoint per company, plus one per warehouse listed in
+    Saturn Settings. Stock balance reports start from the nearest checkpoint
+    with matching filters instead of reading the ledger from the beginning.
+    ERPNext prepares the submitted checkpoints in a background job.
+    """
+    settings = frappe.get_single("Saturn Settings")
+    if not cint(settings.auto_closing_stock_balance):
+        return
+
+    to_date = get_last_day(add_months(today(), -1))
+    from_date = get_first_day(to_date)
+
+    warehouses = {}
+    for row in frappe.get_all("Warehouse",
+                              filters={"name": ["in", [d.warehouse for d in settings.closing_balance_warehouses] or [""]]},
+                              fields=["name", "company"]):
+        warehouses.setdefault(row.company, []).append(row.name)
+
+    for company in frappe.get_all("Company", pluck="name"):
+        for warehouse in [None, *warehouses.get(company, [])]:
+            try:
+                create_closing_balance(company, from_date, to_date, warehouse)
+            except Exception:
+                frappe.db.rollback()
+                frappe.log_error(
+                    title=f"Saturn: Closing Stock Balance Failed for {warehouse or company}",
+                    message=frappe.get_traceback()
+                )
+            else:
+                frappe.db.commit()
+
+
+def create_closing_balance(company, from_date, to_date, warehouse=None):
+    if frappe.db.exists("Closing Stock Balance", {
+        "company": company,
+        "to_date": to_date,
+        "warehouse": warehouse or ("is", "not set"),
+        "item_code": ("is", "not set"),
+        "item_group": ("is", "not set"),
+        "warehouse_type": ("is", "not set"),
+        "docstatus": ("<", 2)
+    }):
+        return
+
+    closing_balance = frappe.new_doc("Closing Stock Balance")
+    closing_balance.update({
+        "company": company,
+        "from_date": from_date,
+        "to_date": to_date,
+        "warehouse": warehouse
+    })
+    closing_balance.flags.ignore_permissions = True
+    closing_balance.insert()
+    closing_balance.submit()
+
+    return closing_balance
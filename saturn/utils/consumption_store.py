@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import frappe
+from frappe.utils import add_days, add_to_date, cint, now_datetime, today
+
+# The watermark trails the clock so ledger entries still inside an open
+# transaction when the store is updated are picked up by the next update
+WATERMARK_LAG_MINUTES = 10
+
+# A cancellation creates reversing entries with the opposite quantity and marks
+# both sides as cancelled; `sle` is such a reversing entry when an earlier
+# cancelled entry of the same voucher row carries the opposite quantity
+REVERSING_ENTRY = """EXISTS (
+    SELECT 1 FROM `tabStock Ledger Entry` original
+    WHERE original.voucher_type = sle.voucher_type
+    AND original.voucher_no = sle.voucher_no
+    AND original.voucher_detail_no <=> sle.voucher_detail_no
+    AND original.item_code = sle.item_code
+    AND original.warehouse = sle.warehouse
+    AND original.is_cancelled = 1
+    AND original.actual_qty = -sle.actual_qty
+    AND original.creation < sle.creation
+)"""
+
+
+def update_consumption_store():
+    """Bring `Saturn Daily Consumption` up to date with the Stock Ledger.
+
+    Only ledger entries created after the stored watermark are read, so the
+    nightly cost follows the day's activity instead of the size of the
+    analysis window. The store is rebuilt from scratch when it has never been
+    built or when a profile now needs more history than the store keeps.
+    """
+    watermark = frappe.db.get_single_value("Saturn Settings", "consumption_watermark")
+    kept_days = cint(frappe.db.get_single_value("Saturn Settings", "consumption_retention_days"))
+    retention_days = get_retention_days()
+    new_watermark = add_to_date(now_datetime(), minutes=-WATERMARK_LAG_MINUTES)
+
+    if not watermark or retention_days > kept_days:
+        rebuild_consumption_store(retention_days, new_watermark)
+    else:
+        apply_ledger_delta(watermark, new_watermark, retention_days)
+        prune_consumption_store(retention_days)
+
+    frappe.db.set_single_value("Saturn Settings", {
+        "consumption_watermark": new_watermark,
+        "consumption_retention_days": retention_days
+    })
+
+
+def get_retention_days():
+    """The longest analysis period of any profile is all the history the engine reads."""
+    return cint(frappe.db.sql("""
+        SELECT MAX(analysis_period) FROM `tabSaturn Reorder Profile`
+    """)[0][0])
+
+
+def rebuild_consumption_store(retention_days, upto):
+    frappe.db.sql("DELETE FROM `tabSaturn Daily Consumption`")
+    apply_ledger_delta(None, upto, retention_days)
+
+
+def apply_ledger_delta(watermark, upto, retention_days):
+    """Apply the ledger entries created in (watermark, upto].
+
+    Entries are selected by `creation` only, which never changes, so every
+    entry is applied exactly once whatever happens to it later: an outgoing
+    entry adds its quantity even if it is cancelled afterwards, and the
+    reversing entry written by that cancellation subtracts it again in the
+    window it was created in.
+    """
+    conditions = "sle.creation <= %(upto)s"
+    if watermark:
+        conditions += " AND sle.creation > %(watermark)s"
+    values = {"watermark": watermark, "upto": upto}
+
+    # إضافة الحركات الصادرة الأصلية (وليس القيود العكسية للإلغاء)
+    upsert_consumption(f"""
+        sle.actual_qty < 0
+        AND (sle.is_cancelled = 0 OR NOT {REVERSING_ENTRY})
+        AND {conditions}
+    """, values, retention_days)
+
+    # طرح القيود العكسية التي أنشأها إلغاء حركات صادرة
+    upsert_consumption(f"""
+        sle.actual_qty > 0
+        AND sle.is_cancelled = 1
+        AND {REVERSING_ENTRY}
+        AND {conditions}
+    """, values, retention_days)
+
+
+def upsert_consumption(conditions, values, retention_days):
+    """Aggregate matching ledger rows per item, warehouse and day and add their
+    outgoing quantity to the store; reversing entries carry a positive
+    quantity and so subtract. Row names are derived from the key, so an
+    existing day is incremented in place instead of duplicated."""
+    values = dict(values, from_date=add_days(today(), -retention_days), now=now_datetime(),
+                  user=frappe.session.user)
+
+    frappe.db.sql(f"""
+        INSERT INTO `tabSaturn Daily Consumption`
+            (name, item_code, warehouse, posting_date, consumed_qty,
+             creation, modified, owner, modified_by, docstatus, idx)
+        SELECT
+            MD5(CONCAT_WS('::', sle.item_code, sle.warehouse, sle.posting_date)),
+            sle.item_code, sle.warehouse, sle.posting_date,
+            SUM(sle.actual_qty * -1),
+            %(now)s, %(now)s, %(user)s, %(user)s, 0, 0
+        FROM `tabStock Ledger Entry` sle
+        WHERE sle.posting_date >= %(from_date)s
+        AND {conditions}
+        GROUP BY sle.item_code, sle.warehouse, sle.posting_date
+        ON DUPLICATE KEY UPDATE
+            consumed_qty = consumed_qty + VALUES(consumed_qty),
+            modified = VALUES(modified)
+    """, values)
+
+
+def prune_consumption_store(retention_days):
+    frappe.db.sql("""
+        DELETE FROM `tabSaturn Daily Consumption`
+        WHERE posting_date < %s
+    """, (add_days(today(), -retention_days),))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+import frappe
+
+
+class PhaseTimer:
+    """Accumulate wall time per named phase and count the SQL queries run while
+    the timer is active.
+
+        timer = PhaseTimer()
+        with timer:
+            with timer.phase("write_time"):
+                ...
+        timer.timings["write_time"], timer.query_count
+    """
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.query_count = 0
+        self._patched = []
+
+    @contextmanager
+    def phase(self, name):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += perf_counter() - start
+
+    def __enter__(self):
+        self.count_queries(frappe.db)
+        frappe.local.saturn_phase_timers = [*get_active_timers(), self]
+        return self
+
+    def __exit__(self, *exc_info):
+        for db, original_sql in reversed(self._patched):
+            db.sql = original_sql
+        self._patched = []
+
+        frappe.local.saturn_phase_timers = [timer for timer in get_active_timers() if timer is not self]
+
+    def count_queries(self, db):
+        original_sql = db.sql
+
+        def counted_sql(*args, **kwargs):
+            self.query_count += 1
+            return original_sql(*args, **kwargs)
+
+        db.sql = counted_sql
+        self._patched.append((db, original_sql))
+
+
+def get_active_timers():
+    return getattr(frappe.local, "saturn_phase_timers", None) or []
+
+
+def count_swapped_connection(db):
+    """Count queries on a connection swapped in while timers are active, such as the
+    read replica, which the timers' patch of the primary connection does not see."""
+    for timer in get_active_timers():
+        timer.count_queries(db)
@@ -1,9 +1,43 @@
 # -*- coding: utf-8 -*-
 import frappe
-from frappe.utils import flt, add_days, today
+from frappe.utils import cint, flt, add_days, now_datetime, today
+
+from saturn.utils.consumption_store import update_consumption_store
+from saturn.utils.demand_forecast import forecast_reorder_levels
+from saturn.utils.instrumentation import PhaseTimer
+from saturn.utils.item_reorder import bulk_upsert_item_reorder
+from saturn.utils.replica import read_from_replica
+from saturn.utils.reorder_requests import create_material_requests_for_run
+
+DEFAULT_CHUNK_SIZE = 500
+RUN_COUNTERS = (
+    "items_scanned", "items_updated", "items_skipped", "items_failed",
+    "consumption_time", "write_time", "query_count"
+)
 
 @frappe.whitelist()
+def enqueue_reorder_update():
+    """Run the coordinator from the Settings button on the long queue; it may
+    rebuild the consumption store, which does not fit in a web request."""
+    frappe.only_for("System Manager")
+    frappe.enqueue(
+        "saturn.utils.inventory_engine.execute_daily_reorder_update",
+        queue="long",
+        timeout=3600,
+        job_id="saturn_reorder_update",
+        deduplicate=True
+    )
+
+    return "Queued: the reorder update will run in the background."
+
+
 def execute_daily_reorder_update():
+    """Coordinator: split smart-reorder items into chunks and enqueue one job per chunk.
+
+    Each chunk commits on its own and adds its counters to a `Saturn Reorder Run Log`;
+    the last chunk to finish raises material requests for the levels the run
+    changed, so they see every updated level.
+    """
     # 1. التحقق من تفعيل النظام وجلب البروفايل الافتراضي
     settings = frappe.get_single("Saturn Settings")
     if not settings.enabled:
@@ -12,98 +46,271 @@ def execute_daily_reorder_update():
     if not settings.default_reorder_profile:
         return "Error: Please set a Default Reorder Profile in Saturn Settings."
 
-    # جلب وثيقة البروفايل الافتراضي لاستخدام قيمها كاحتياط (Fallback)
-    default_profile_doc = frappe.get_doc("Saturn Reorder Profile", settings.default_reorder_profile)
-    
-    # 2. جلب الأصناف (المخزنية وغير المعطلة)
-    items = frappe.get_all("Item", 
-                           filters={
-                               "is_stock_item": 1,
-                               "is_smart_reorder": 1,
-                               "disabled": 0
-                           }, 
+    run_log = frappe.get_doc({"doctype": "Saturn Reorder Run Log", "status": "Running", "started_at": now_datetime()})
+    run_log.insert(ignore_permissions=True)
+    # اعتماد السجل فوراً حتى لا يمحوه التراجع عند فشل التشغيل
+    frappe.db.commit()
+
+    timer = PhaseTimer()
+    try:
+        with timer:
+            # 2. جلب الأصناف (المخزنية وغير المعطلة)
+            item_codes = frappe.get_all("Item",
+                                        filters={
+                                            "is_stock_item": 1,
+                                            "is_smart_reorder": 1,
+                                            "disabled": 0
+                                        },
+                                        pluck="name",
+                                        order_by="name")
+
+            # 3. تحديث مخزن الاستهلاك اليومي بالحركات الجديدة فقط قبل توزيع العمل
+            with timer.phase("consumption_time"):
+                update_consumption_store()
+    except Exception:
+        frappe.db.rollback()
+        run_log.db_set({"status": "Failed", "ended_at": now_datetime()})
+        frappe.db.commit()
+        raise
+
+    # 4. تقسيم الأصناف إلى دفعات وإرسال كل دفعة إلى عامل خلفية مستقل
+    chunk_size = cint(settings.reorder_chunk_size) or DEFAULT_CHUNK_SIZE
+    chunks = [item_codes[i:i + chunk_size] for i in range(0, len(item_codes), chunk_size)]
+
+    run_log.db_set({
+        "total_chunks": len(chunks),
+        "consumption_time": timer.timings["consumption_time"],
+        "query_count": timer.query_count
+    })
+    frappe.db.commit()
+
+    if not chunks:
+        finish_reorder_run(run_log.name)
+        return "Success: No smart reorder items to process."
+
+    for chunk in chunks:
+        frappe.enqueue(
+            "saturn.utils.inventory_engine.process_reorder_chunk",
+            queue="long",
+            run_id=run_log.name,
+            item_codes=chunk,
+            default_profile=settings.default_reorder_profile,
+            user=frappe.session.user,
+            enqueue_after_commit=True
+        )
+
+    return f"Queued: {len(item_codes)} items in {len(chunks)} chunks ({run_log.name})."
+
+
+def process_reorder_chunk(run_id, item_codes, default_profile, user=None):
+    """Update reorder levels for one chunk of items and commit it independently."""
+    timer = PhaseTimer()
+    stats = frappe._dict(items_scanned=len(item_codes), items_failed=len(item_codes))
+
+    try:
+        with timer:
+            stats = update_reorder_levels(item_codes, default_profile, timer)
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(message=frappe.get_traceback(), title=f"Saturn Reorder Chunk Failed: {run_id}")
+    finally:
+        stats.update(timer.timings, query_count=timer.query_count)
+        mark_chunk_done(run_id, stats, user)
+
+
+def update_reorder_levels(item_codes, default_profile, timer=None):
+    timer = timer or PhaseTimer()
+    items = frappe.get_all("Item",
+                           filters={"name": ["in", item_codes]},
                            fields=["name", "custom_reorder_profile"])
 
-    processed_count = 0
-    
+    # تحديد البروفايل النشط لكل صنف (الخاص به أو الافتراضي العام)
+    # يتم تحميل كل بروفايل مرة واحدة فقط بدلاً من مرة لكل صنف
+    default_profile_doc = frappe.get_doc("Saturn Reorder Profile", default_profile)
+    item_profiles = get_item_profiles(items, default_profile_doc)
+
+    # أصناف البروفايلات بنمط التنبؤ تُحسب دفعة واحدة لكل بروفايل بعمليات مصفوفية
+    forecast_items = {}
+    for item_code, profile in item_profiles.items():
+        if profile.engine_mode == "Forecast" and profile.default_warehouse:
+            forecast_items.setdefault(profile.name, []).append(item_code)
+
+    reorder_rows = []
+
+    for profile_item_codes in forecast_items.values():
+        profile = item_profiles[profile_item_codes[0]]
+        with timer.phase("consumption_time"):
+            levels = forecast_reorder_levels(profile, profile_item_codes)
+
+        for item_code, (new_level, new_qty) in levels.items():
+            reorder_rows.append({
+                "item_code": item_code,
+                "warehouse": profile.default_warehouse,
+                "warehouse_reorder_level": new_level,
+                "warehouse_reorder_qty": new_qty,
+                "material_request_type": "Purchase"
+            })
+
+    # قراءة المجاميع المتحركة من مخزن الاستهلاك باستعلام مجمّع واحد لكل فترة تحليل
+    flat_profiles = [profile for profile in item_profiles.values() if profile.engine_mode != "Forecast"]
+    periods = {int(profile.analysis_period) for profile in flat_profiles}
+    with timer.phase("consumption_time"):
+        consumption_by_period = get_consumption_by_period(periods, item_codes)
+
+    failed_count = 0
+
     for item in items:
         try:
             item_code = item.name
-            
-            # 3. تحديد البروفايل النشط للصنف (الخاص به أو الافتراضي العام)
-            if item.custom_reorder_profile:
-                profile = frappe.get_doc("Saturn Reorder Profile", item.custom_reorder_profile)
-            else:
-                profile = default_profile_doc
+            profile = item_profiles[item_code]
+            if profile.engine_mode == "Forecast":
+                continue
 
             # جلب المعايير من البروفايل المعتمد
-            analysis_period = profile.analysis_period
+            analysis_period = int(profile.analysis_period)
             coverage_months = profile.coverage_months
             safety_stock_percent = profile.safety_stock_percent
-            target_warehouse = profile.default_warehouse 
-
-            if not target_warehouse:
-                continue # لا يمكن حساب إعادة الطلب بدون تحديد مستودع هدف في البروفايل
-
-            # 4. حساب الاستهلاك بناءً على فترة التحليل
-            start_date = add_days(today(), -int(analysis_period))
-            
-            consumed_qty = frappe.db.sql("""
-                SELECT SUM(actual_qty * -1) 
-                FROM `tabStock Ledger Entry` 
-                WHERE item_code = %s 
-                AND actual_qty < 0 
-                AND posting_date >= %s
-            """, (item_code, start_date))[0][0] or 0
+            target_warehouse = profile.default_warehouse
+
+            if not target_warehouse or analysis_period <= 0:
+                continue # لا يمكن حساب إعادة الطلب بدون تحديد مستودع هدف وفترة تحليل في البروفايل
+
+            consumed_qty = consumption_by_period[analysis_period].get(item_code) or 0
 
             if consumed_qty > 0:
                 daily_usage = flt(consumed_qty) / flt(analysis_period)
                 coverage_days = flt(coverage_months) * 30
                 safety_factor = 1 + (flt(safety_stock_percent) / 100)
-                
+
                 # الحسابات النهائية (LaTeX للتوضيح الرياضي)
                 # $$ Reorder Level = (Daily Usage \times Coverage Days) \times Safety Factor $$
                 new_level = flt(daily_usage * coverage_days * safety_factor, 2)
                 new_qty = flt(daily_usage * coverage_days, 2)
 
-                # 5. تحديث أو إضافة المستويات في جدول إعادة الطلب (Item Reorder)
-                # نبحث عن سطر يطابق الصنف والمستودع المستهدف من البروفايل
-                existing_row = frappe.db.get_value("Item Reorder", 
-                                                 {"parent": item_code, "warehouse": target_warehouse}, 
-                                                 "name")
-                
-                if existing_row:
-                    # تحديث السطر الموجود للمستودع المحدد
-                    frappe.db.set_value("Item Reorder", existing_row, {
-                        "warehouse_reorder_level": new_level,
-                        "warehouse_reorder_qty": new_qty,
-                        "material_request_type": "Purchase"
-                    }, update_modified=True)
-                else:
-                    # إضافة سطر جديد للمستودع المحدد إذا لم يكن موجوداً
-                    item_doc = frappe.get_doc("Item", item_code)
-                    item_doc.append("reorder_levels", {
-                        "warehouse": target_warehouse,
-                        "warehouse_reorder_level": new_level,
-                        "warehouse_reorder_qty": new_qty,
-                        "material_request_type": "Purchase"
-                    })
-                    item_doc.flags.ignore_mandatory = True
-                    item_doc.flags.ignore_validate = True
-                    item_doc.save(ignore_permissions=True)
-                
-                processed_count += 1
+                # تجميع المستويات الجديدة لكتابتها دفعة واحدة في جدول إعادة الطلب (Item Reorder)
+                # للصنف والمستودع المستهدف من البروفايل
+                reorder_rows.append({
+                    "item_code": item_code,
+                    "warehouse": target_warehouse,
+                    "warehouse_reorder_level": new_level,
+                    "warehouse_reorder_qty": new_qty,
+                    "material_request_type": "Purchase"
+                })
 
         except Exception:
+            failed_count += 1
             frappe.log_error(message=frappe.get_traceback(), title=f"Saturn Profile Error: {item_code}")
 
+    # كتابة جميع التحديثات والإضافات بعبارات SQL متعددة الصفوف مع تجاهل الصفوف غير المتغيرة
+    with timer.phase("write_time"):
+        written = bulk_upsert_item_reorder(reorder_rows)
+
+    updated_count = written.inserted + written.updated
+    return frappe._dict(
+        items_scanned=len(items),
+        items_updated=updated_count,
+        items_failed=failed_count,
+        items_skipped=len(items) - updated_count - failed_count
+    )
+
+
+def get_item_profiles(items, default_profile_doc):
+    """Map every item to its reorder profile, loading each profile only once."""
+    profiles = {default_profile_doc.name: default_profile_doc}
+    item_profiles = {}
+
+    for item in items:
+        profile_name = item.custom_reorder_profile or default_profile_doc.name
+        if profile_name not in profiles:
+            profiles[profile_name] = frappe.get_doc("Saturn Reorder Profile", profile_name)
+
+        item_profiles[item.name] = profiles[profile_name]
+
+    return item_profiles
+
+
+@read_from_replica("replica_for_consumption_reads")
+def get_consumption_by_period(periods, item_codes):
+    """Return {analysis_period: {item_code: consumed_qty}} with one grouped query per period,
+    read from the rolling `Saturn Daily Consumption` store."""
+    consumption_by_period = {}
+
+    for analysis_period in periods:
+        if analysis_period <= 0:
+            continue
+
+        start_date = add_days(today(), -analysis_period)
+
+        consumption_by_period[analysis_period] = frappe._dict(frappe.db.sql("""
+            SELECT item_code, SUM(consumed_qty)
+            FROM `tabSaturn Daily Consumption`
+            WHERE posting_date >= %(start_date)s
+            AND item_code IN %(item_codes)s
+            GROUP BY item_code
+        """, {"start_date": start_date, "item_codes": tuple(item_codes)}))
+
+    return consumption_by_period
+
+
+@frappe.whitelist()
+def get_reorder_run_progress(run_id):
+    return frappe.db.get_value("Saturn Reorder Run Log", run_id,
+                               ["name", "status", "chunks_done", "total_chunks"], as_dict=True)
+
+
+def mark_chunk_done(run_id, stats, user=None):
+    # التحديث الذرّي لسجل التشغيل يضمن أن آخر دفعة فقط هي التي تطلق المرحلة النهائية؛
+    # قفل الصف يجعل الدفعات المتزامنة تنتظر بعضها حتى الاعتماد
+    assignments = ", ".join(f"`{field}` = `{field}` + %({field})s" for field in RUN_COUNTERS)
+    frappe.db.sql(f"""
+        UPDATE `tabSaturn Reorder Run Log`
+        SET chunks_done = chunks_done + 1, {assignments}
+        WHERE name = %(run_id)s
+    """, dict({field: stats.get(field) or 0 for field in RUN_COUNTERS}, run_id=run_id))
+
+    done, total = frappe.db.get_value("Saturn Reorder Run Log", run_id, ["chunks_done", "total_chunks"])
     frappe.db.commit()
 
-    # 6. تشغيل محرك إعادة الطلب الرسمي لإنشاء Material Requests
+    if user:
+        frappe.publish_realtime(
+            "saturn_reorder_progress",
+            {"run_id": run_id, "done": done, "total": total},
+            user=user
+        )
+
+    if done == total:
+        finish_reorder_run(run_id)
+
+
+def finish_reorder_run(run_id):
+    # إنشاء Material Requests بعد انتهاء جميع الدفعات للأصناف والمستودعات التي تغيرت مستوياتها فقط
+    # بدلاً من إعادة فحص جميع الأصناف عبر reorder_item() في ERPNext
+    timer = PhaseTimer()
+    status = "Completed"
+    material_requests_created = 0
+
     try:
-        from erpnext.stock.reorder_item import reorder_item
-        reorder_item()
+        with timer, timer.phase("material_request_time"):
+            material_requests_created = create_material_requests_for_run(run_id)
     except Exception:
+        frappe.db.rollback()
+        status = "Failed"
         frappe.log_error(title="Saturn: Auto MR Trigger Failed", message=frappe.get_traceback())
 
-    return f"Success: Processed {processed_count} items using Profile logic."
\ No newline at end of file
+    frappe.db.sql("""
+        UPDATE `tabSaturn Reorder Run Log`
+        SET status = %(status)s, ended_at = %(ended_at)s,
+            material_request_time = %(material_request_time)s,
+            material_requests_created = %(material_requests_created)s,
+            query_count = query_count + %(query_count)s
+        WHERE name = %(run_id)s
+    """, {
+        "status": status,
+        "ended_at": now_datetime(),
+        "material_request_time": timer.timings["material_request_time"],
+        "material_requests_created": material_requests_created,
+        "query_count": timer.query_count,
+        "run_id": run_id
+    })
+    frappe.db.commit()
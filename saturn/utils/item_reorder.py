@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import frappe
+from frappe.utils import cint, flt, now
+
+from saturn.utils.batching import BATCH_SIZE, get_batches
+
+COMPARED_FIELDS = ("warehouse_reorder_level", "warehouse_reorder_qty", "material_request_type", "warehouse_group")
+FLOAT_FIELDS = ("warehouse_reorder_level", "warehouse_reorder_qty")
+
+
+def bulk_upsert_item_reorder(rows):
+    """Insert or update `Item Reorder` rows keyed by (item_code, warehouse) with a few
+    multi-row statements instead of saving every Item.
+
+    Each row is a dict with `item_code`, `warehouse`, `warehouse_reorder_level`,
+    `warehouse_reorder_qty` and optionally `material_request_type` and
+    `warehouse_group`. Rows whose values are unchanged are skipped.
+
+    Returns a dict with the counts of inserted, updated and unchanged rows.
+    """
+    stats = frappe._dict(inserted=0, updated=0, unchanged=0)
+    if not rows:
+        return stats
+
+    precision = cint(frappe.db.get_default("float_precision")) or 3
+    existing, max_idx = get_existing_reorder_rows({row["item_code"] for row in rows})
+
+    inserts, updates = [], []
+    for row in rows:
+        key = (row["item_code"], row["warehouse"])
+        current_rows = existing.get(key)
+
+        if not current_rows:
+            max_idx[row["item_code"]] = max_idx.get(row["item_code"], 0) + 1
+            inserts.append((row, max_idx[row["item_code"]]))
+            continue
+
+        for current in current_rows:
+            if is_reorder_row_changed(current, row, precision):
+                updates.append((current.name, row))
+            else:
+                stats.unchanged += 1
+
+    insert_reorder_rows(inserts)
+    update_reorder_rows(updates)
+
+    stats.inserted = len(inserts)
+    stats.updated = len(updates)
+
+    clear_item_cache({row["item_code"] for row, _idx in inserts} | {row["item_code"] for _name, row in updates})
+
+    return stats
+
+
+def bulk_delete_item_reorder(item_codes, warehouse):
+    """Remove the reorder rows of `warehouse` from all given items."""
+    item_codes = list(set(item_codes))
+
+    for batch in get_batches(item_codes):
+        frappe.db.sql("""
+            DELETE FROM `tabItem Reorder`
+            WHERE parenttype = 'Item'
+            AND parentfield = 'reorder_levels'
+            AND warehouse = %(warehouse)s
+            AND parent IN %(items)s
+        """, {"warehouse": warehouse, "items": tuple(batch)})
+
+    clear_item_cache(item_codes)
+
+
+def get_existing_reorder_rows(item_codes):
+    existing, max_idx = {}, {}
+
+    for batch in get_batches(list(item_codes)):
+        for row in frappe.db.sql("""
+            SELECT name, parent, idx, warehouse, warehouse_group,
+                warehouse_reorder_level, warehouse_reorder_qty, material_request_type
+            FROM `tabItem Reorder`
+            WHERE parenttype = 'Item'
+            AND parentfield = 'reorder_levels'
+            AND parent IN %(items)s
+        """, {"items": tuple(batch)}, as_dict=True):
+            existing.setdefault((row.parent, row.warehouse), []).append(row)
+            max_idx[row.parent] = max(max_idx.get(row.parent, 0), cint(row.idx))
+
+    return existing, max_idx
+
+
+def is_reorder_row_changed(current, row, precision):
+    for fieldname in COMPARED_FIELDS:
+        if fieldname not in row:
+            continue
+
+        if fieldname in FLOAT_FIELDS:
+            if flt(current.get(fieldname), precision) != flt(row[fieldname], precision):
+                return True
+        elif (current.get(fieldname) or None) != (row[fieldname] or None):
+            return True
+
+    return False
+
+
+def insert_reorder_rows(inserts):
+    if not inserts:
+        return
+
+    timestamp, user = now(), frappe.session.user
+    fields = [
+        "name", "parent", "parenttype", "parentfield", "idx", "docstatus",
+        "warehouse", "warehouse_group", "warehouse_reorder_level", "warehouse_reorder_qty",
+        "material_request_type", "creation", "modified", "owner", "modified_by"
+    ]
+
+    values = [
+        (
+            frappe.generate_hash(length=10), row["item_code"], "Item", "reorder_levels", idx, 0,
+            row["warehouse"], row.get("warehouse_group"),
+            flt(row["warehouse_reorder_level"]), flt(row["warehouse_reorder_qty"]),
+            row.get("material_request_type") or "Purchase",
+            timestamp, timestamp, user, user
+        )
+        for row, idx in inserts
+    ]
+
+    frappe.db.bulk_insert("Item Reorder", fields=fields, values=values, chunk_size=BATCH_SIZE)
+
+
+def update_reorder_rows(updates):
+    """Apply updates in batches of one `UPDATE ... SET col = CASE name ...` statement each."""
+    if not updates:
+        return
+
+    timestamp, user = now(), frappe.session.user
+
+    for batch in get_batches(updates):
+        assignments, values = [], []
+        for fieldname in COMPARED_FIELDS:
+            rows = [(name, row) for name, row in batch if fieldname in row]
+            if not rows:
+                continue
+
+            cases = []
+            for name, row in rows:
+                cases.append("WHEN %s THEN %s")
+                values.extend([name, row[fieldname]])
+
+            assignments.append(f"`{fieldname}` = CASE name {' '.join(cases)} ELSE `{fieldname}` END")
+
+        values.extend([timestamp, user, tuple(name for name, _row in batch)])
+
+        frappe.db.sql(f"""
+            UPDATE `tabItem Reorder`
+            SET {', '.join(assignments)}, modified = %s, modified_by = %s
+            WHERE name IN %s
+        """, tuple(values))
+
+
+def clear_item_cache(item_codes):
+    for item_code in item_codes:
+        frappe.clear_document_cache("Item", item_code)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import frappe
+from frappe.utils import add_days, cint, flt, nowdate
+
+
+def create_material_requests_for_run(run_id):
+    """Raise material requests only for the reorder rows a run touched.
+
+    Unlike ERPNext's `reorder_item()`, which re-scans every item with reorder
+    settings, this reads the Item Reorder rows written since the run started
+    together with their `Bin` in one query, and creates one Material Request
+    per warehouse and request type. Returns the number of requests created.
+    """
+    if not cint(frappe.db.get_single_value("Stock Settings", "auto_indent")):
+        return 0
+
+    started_at = frappe.db.get_value("Saturn Reorder Run Log", run_id, "started_at")
+    material_requests = {}
+
+    for row in get_items_below_reorder_level(started_at):
+        # $$ Qty = \max(Reorder Level - Projected Qty,\ Reorder Qty) $$
+        qty = max(flt(row.warehouse_reorder_level) - flt(row.projected_qty), flt(row.warehouse_reorder_qty))
+        row.qty = qty
+        material_requests.setdefault((row.warehouse, row.material_request_type or "Purchase"), []).append(row)
+
+    created = 0
+    for (warehouse, request_type), rows in material_requests.items():
+        try:
+            make_material_request(warehouse, request_type, rows)
+            created += 1
+        except Exception:
+            frappe.db.rollback()
+            frappe.log_error(
+                title=f"Saturn: Material Request Failed for {warehouse}",
+                message=frappe.get_traceback()
+            )
+        else:
+            frappe.db.commit()
+
+    return created
+
+
+def get_items_below_reorder_level(since):
+    """Touched reorder rows that ERPNext's `reorder_item()` would raise a request for.
+
+    As there, the projected qty is that of `warehouse_group` when it is set (every
+    warehouse in its lft/rgt range) and of the row's warehouse otherwise, a request
+    is due once it is at or below the reorder level, and disabled warehouses are
+    skipped.
+    """
+    return frappe.db.sql("""
+        SELECT
+            ir.parent AS item_code, ir.warehouse, ir.warehouse_reorder_level,
+            ir.warehouse_reorder_qty, ir.material_request_type,
+            item.item_name, item.stock_uom, item.lead_time_days, wh.company,
+            IFNULL((
+                SELECT SUM(bin.projected_qty)
+                FROM `tabBin` bin
+                INNER JOIN `tabWarehouse` bin_wh ON bin_wh.name = bin.warehouse
+                WHERE bin.item_code = ir.parent
+                AND bin_wh.lft >= projected_wh.lft AND bin_wh.rgt <= projected_wh.rgt
+            ), 0) AS projected_qty
+        FROM `tabItem Reorder` ir
+        INNER JOIN `tabItem` item ON item.name = ir.parent
+        INNER JOIN `tabWarehouse` wh ON wh.name = ir.warehouse
+        INNER JOIN `tabWarehouse` projected_wh
+            ON projected_wh.name = IFNULL(NULLIF(ir.warehouse_group, ''), ir.warehouse)
+        WHERE ir.parenttype = 'Item'
+        AND ir.parentfield = 'reorder_levels'
+        AND ir.modified >= %(since)s
+        AND item.is_smart_reorder = 1
+        AND item.disabled = 0
+        AND wh.disabled = 0
+        AND (ir.warehouse_reorder_level > 0 OR ir.warehouse_reorder_qty > 0)
+        HAVING projected_qty <= warehouse_reorder_level
+        ORDER BY ir.warehouse, ir.parent
+    """, {"since": since}, as_dict=True)
+
+
+def make_material_request(warehouse, request_type, rows):
+    today = nowdate()
+
+    mr = frappe.new_doc("Material Request")
+    mr.update({
+        "company": rows[0].company,
+        "transaction_date": today,
+        "set_warehouse": warehouse,
+        "material_request_type": "Material Transfer" if request_type == "Transfer" else request_type
+    })
+
+    for row in rows:
+        schedule_date = add_days(today, cint(row.lead_time_days))
+        mr.append("items", {
+            "item_code": row.item_code,
+            "item_name": row.item_name,
+            "warehouse": warehouse,
+            "qty": row.qty,
+            "uom": row.stock_uom,
+            "stock_uom": row.stock_uom,
+            "conversion_factor": 1,
+            "schedule_date": schedule_date
+        })
+
+    mr.schedule_date = min(item.schedule_date for item in mr.items)
+    mr.flags.ignore_permissions = True
+    mr.insert()
+    mr.submit()
+
+    return mr
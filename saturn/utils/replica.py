@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint
+
+from saturn.utils.instrumentation import count_swapped_connection
+
+
+@contextmanager
+def read_from_replica(setting):
+    """Run the enclosed reads on the read-only replica.
+
+    Only applies when the site has `read_from_replica` configured and the
+    `setting` check in Saturn Settings is on; otherwise, or if the replica
+    cannot be reached, the block runs on the primary. Usable as a context
+    manager or as a decorator:
+
+        @frappe.whitelist()
+        @read_from_replica("replica_for_item_scan")
+        def get_item_details_and_stock(scanned_value):
+            ...
+    """
+    if not use_replica(setting):
+        yield
+        return
+
+    connected = False
+    try:
+        # connect_replica returns False when an outer frappe.read_only() already switched
+        connected = frappe.connect_replica()
+        if connected:
+            # The replica connects lazily; connect now so failures fall back here
+            # instead of surfacing on the first query of the wrapped block
+            frappe.db.connect()
+            count_swapped_connection(frappe.db)
+    except Exception:
+        if connected:
+            restore_primary()
+        connected = False
+        frappe.log_error(title="Saturn: Read Replica Unavailable", message=frappe.get_traceback())
+
+    try:
+        yield
+    finally:
+        if connected:
+            restore_primary()
+
+
+def restore_primary():
+    replica_db = frappe.local.db
+    frappe.local.db = frappe.local.primary_db
+    del frappe.local.replica_db
+    del frappe.local.primary_db
+    replica_db.close()
+
+
+def use_replica(setting):
+    if not (frappe.conf.read_from_replica and frappe.conf.replica_host):
+        return False
+
+    return bool(cint(frappe.db.get_single_value("Saturn Settings", setting)))
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""Background export of the Stock Balance With Barcode Scanning Feature report.
+
+Rows are written to a private file as the report yields them, instead of
+building the full JSON payload in a web worker first.
+"""
+import csv
+import os
+
+import frappe
+from frappe import _
+from frappe.utils import now_datetime
+
+from saturn.utils.replica import read_from_replica
+
+REPORT = "Stock Balance With Barcode Scanning Feature"
+FILE_FORMATS = ("CSV", "Parquet")
+PARQUET_BATCH_SIZE = 10_000
+
+
+@frappe.whitelist()
+def export_report(filters, file_format="CSV"):
+    """Queue an export of the report and notify the user when the file is ready."""
+    if not frappe.get_doc("Report", REPORT).is_permitted():
+        frappe.throw(_("You don't have access to Report: {0}").format(REPORT), frappe.PermissionError)
+
+    if file_format not in FILE_FORMATS:
+        frappe.throw(_("File format must be one of {0}").format(", ".join(FILE_FORMATS)))
+
+    if file_format == "Parquet":
+        get_pyarrow()
+
+    frappe.enqueue(
+        "saturn.utils.stock_balance_export.export_report_job",
+        queue="long",
+        timeout=3600,
+        filters=frappe.parse_json(filters),
+        file_format=file_format,
+        user=frappe.session.user
+    )
+
+    return _("The export has been queued, you will be notified when the file is ready.")
+
+
+def export_report_job(filters, file_format, user):
+    file_name = f"{frappe.scrub(REPORT)}-{now_datetime().strftime('%Y%m%d-%H%M%S')}.{file_format.lower()}"
+    path = frappe.get_site_path("private", "files", file_name)
+
+    try:
+        with read_from_replica("replica_for_stock_balance_report"):
+            rows = write_report(frappe._dict(filters), path, file_format)
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+
+        frappe.log_error(title=f"Saturn: {REPORT} Export Failed", message=frappe.get_traceback())
+        frappe.publish_realtime("msgprint", _("The {0} export failed.").format(REPORT), user=user)
+        return
+
+    file_doc = frappe.get_doc({
+        "doctype": "File",
+        "file_name": file_name,
+        "file_url": f"/private/files/{file_name}",
+        "is_private": 1,
+        "attached_to_doctype": "Report",
+        "attached_to_name": REPORT
+    })
+    file_doc.insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    frappe.publish_realtime(
+        "msgprint",
+        _("{0} rows exported: {1}").format(rows, f"<a href='{file_doc.file_url}'>{file_name}</a>"),
+        user=user
+    )
+
+
+def write_report(filters, path, file_format):
+    """Stream report rows into `path` and return the number of rows written."""
+    from saturn.saturn.report.stock_balance_with_barcode_scanning_feature.stock_balance_with_barcode_scanning_feature import (
+        StockBalanceReport,
+    )
+
+    report = StockBalanceReport(filters)
+    rows = report.iter_data()
+    columns = report.get_columns()
+    fieldnames = [column["fieldname"] for column in columns]
+
+    if file_format == "Parquet":
+        return write_parquet(path, columns, fieldnames, rows)
+
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([column["label"] for column in columns])
+
+        for row in rows:
+            writer.writerow([row.get(fieldname) for fieldname in fieldnames])
+            count += 1
+
+    return count
+
+
+def write_parquet(path, columns, fieldnames, rows):
+    pa = get_pyarrow()
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(fieldname, get_arrow_type(pa, column)) for fieldname, column in zip(fieldnames, columns)])
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_SIZE:
+                count += write_parquet_batch(pa, writer, schema, batch)
+                batch = []
+
+        if batch:
+            count += write_parquet_batch(pa, writer, schema, batch)
+
+    return count
+
+
+def write_parquet_batch(pa, writer, schema, batch):
+    data = {}
+    for field in schema:
+        values = [row.get(field.name) for row in batch]
+        if field.type == pa.string():
+            values = [None if value is None else str(value) for value in values]
+        data[field.name] = values
+
+    writer.write_table(pa.Table.from_pydict(data, schema=schema))
+    return len(batch)
+
+
+def get_arrow_type(pa, column):
+    if column.get("fieldtype") in ("Float", "Currency"):
+        return pa.float64()
+    if column.get("fieldtype") == "Int":
+        return pa.int64()
+    return pa.string()
+
+
+def get_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        frappe.throw(_("Parquet export needs the pyarrow package installed on the server"))
+
+    return pyarrow